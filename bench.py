@@ -0,0 +1,197 @@
+import argparse, io, json, random, sys, time, tracemalloc
+import pandas as pd
+from openpyxl import Workbook
+from PIL import Image, ImageDraw
+
+import weekly_image
+from excel_import import COLUMNS, DAYS, SCHEDULE_SHEET, clean_text, parse_sheet, stream_excel_to_json
+from schedule_model import ScheduleModel
+from tests.test_weekly_image import lesson_name, reference_draw_wrapped_text, reference_wrap_text, synthetic_week
+
+
+def timed(function):
+    started = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - started
+
+def per_call(function, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - started) / repeat
+
+def clear_layout_caches():
+    for cache in (weekly_image._measurements, weekly_image._advances, weekly_image._layouts):
+        cache.clear()
+
+def bench_layout(count, seed):
+    """Time one timetable cell and a whole timetable with the original and the memoized layout."""
+    rng = random.Random(seed)
+    font = weekly_image.load_font(22)
+    draw = ImageDraw.Draw(Image.new('RGB', (250, 120)))
+    lessons = [lesson_name(rng) for _ in range(count)]
+    rect = (0, 0, 250, 120)
+
+    def cold_wrap():
+        clear_layout_caches()
+        for text in lessons:
+            weekly_image.wrap_text(draw, text, font, 250)
+
+    reference_wrap = per_call(lambda: [reference_wrap_text(draw, text, font, 250) for text in lessons], 3) / count
+    memoized_wrap = per_call(cold_wrap, 3) / count
+    cached_layout = per_call(lambda: [weekly_image.wrapped_layout(draw, text, 250, 120, font, 20) for text in lessons], 3) / count
+    reference_draw = per_call(lambda: [reference_draw_wrapped_text(draw, text, rect, font) for text in lessons], 3) / count
+    memoized_draw = per_call(lambda: [weekly_image.draw_wrapped_text(draw, text, rect, font) for text in lessons], 3) / count
+    week = synthetic_week(rng)
+    memoized_image = per_call(lambda: weekly_image.generate_weekly_schedule_image(week, "University", "Degree", "Group"), 5)
+
+    print(f"per cell, {count} lessons:")
+    print(f"  wrapping:          {reference_wrap * 1000:.3f} ms -> {memoized_wrap * 1000:.3f} ms cold, {cached_layout * 1000:.3f} ms cached layout")
+    print(f"  draw_wrapped_text: {reference_draw * 1000:.3f} ms -> {memoized_draw * 1000:.3f} ms")
+    print(f"whole timetable:     {memoized_image * 1000:.1f} ms")
+
+
+def iterrows_parse_sheet(sheet_data):
+    """The timetable parser parse_sheet replaced, walking the rows with iterrows."""
+    parsed_schedule = {}
+    for index, row in sheet_data.iterrows():
+        group = clean_text(row['Groups'])
+        time_slot = clean_text(row['Time'])
+        if pd.notna(group) and pd.notna(time_slot):
+            if group not in parsed_schedule:
+                parsed_schedule[group] = {}
+            for day in DAYS:
+                lesson_info = row[day]
+                if pd.notna(lesson_info):
+                    if day not in parsed_schedule[group]:
+                        parsed_schedule[group][day] = {}
+                    parsed_schedule[group][day][time_slot] = [clean_text(info) for info in lesson_info.split(',')]
+    return parsed_schedule
+
+def synthetic_workbook(rows=10000, numeric_groups=False, seed=1):
+    """The bytes of a timetable workbook with padded, multi-line, empty and Cyrillic cells."""
+    rng = random.Random(seed)
+    subjects = ["Математика", "Physics", " History ", "Программирование", "Chemistry\n", "Economics"]
+    teachers = ["Иванов И.И.", "Smith J.", " Петрова А.А. ", "Brown K."]
+    slots = ["08:30-09:50", " 10:00-11:20", "11:30-12:50\n", "13:30-14:50", "15:00-16:20"]
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = SCHEDULE_SHEET
+    sheet.append(COLUMNS + ['Notes'])
+    for row in range(rows):
+        group = 100 + row // 5 if numeric_groups else f" Группа-{row // 5} " if row % 7 == 0 else f"Group-{row // 5}"
+        lessons = [
+            f"{rng.choice(subjects)}, {rng.choice(teachers)} ,Room {rng.randint(1, 400)}" if rng.random() < 0.7 else None
+            for day in DAYS
+        ]
+        sheet.append([None if row % 97 == 0 else group, rng.choice(slots)] + lessons + ["note"])
+    workbook.create_sheet("Extra").append(["ignored"])
+    content = io.BytesIO()
+    workbook.save(content)
+    return content.getvalue()
+
+def bench_excel(file, rows, numeric_groups):
+    """Check and time parse_sheet and stream_excel_to_json against the iterrows parser."""
+    if file:
+        with open(file, 'rb') as f:
+            content = f.read()
+    else:
+        content = synthetic_workbook(rows, numeric_groups)
+
+    sheet_data, read_time = timed(lambda: pd.read_excel(io.BytesIO(content), sheet_name=SCHEDULE_SHEET, usecols=COLUMNS))
+    expected, iterrows_time = timed(lambda: iterrows_parse_sheet(sheet_data))
+    vectorized, vectorized_time = timed(lambda: parse_sheet(sheet_data))
+    streamed, stream_time = timed(lambda: stream_excel_to_json(content))
+
+    expected_json = json.dumps(expected, ensure_ascii=False)
+    if json.dumps(vectorized, ensure_ascii=False) != expected_json:
+        sys.exit("parse_sheet does not match the iterrows parser")
+
+    print(f"{len(sheet_data)} rows, {len(expected)} groups; read_excel {read_time:.2f}s")
+    print(f"iterrows:             {iterrows_time:.2f}s parse, {read_time + iterrows_time:.2f}s with read_excel")
+    print(f"parse_sheet:          {vectorized_time:.2f}s parse, {read_time + vectorized_time:.2f}s with read_excel")
+    print(f"stream_excel_to_json: {stream_time:.2f}s end to end")
+    if json.dumps(streamed, ensure_ascii=False) != expected_json:
+        # openpyxl keeps whole numbers as ints where pandas may read a float column
+        print("Note: stream_excel_to_json differs from the pandas parsers on this workbook")
+
+
+def synthetic_schedules(universities=3, degrees=8, groups=120, seed=1):
+    """A large schedules.json-shaped dataset with realistic repetition."""
+    rng = random.Random(seed)
+    subjects = [f"Subject {i}" for i in range(150)]
+    teachers = [f"Teacher {i}" for i in range(300)]
+    rooms = [f"Room {i}" for i in range(80)]
+    slots = ["08:30-09:50", "10:00-11:20", "11:30-12:50", "13:30-14:50", "15:00-16:20", "16:30-17:50"]
+    schedules = {}
+    for u in range(universities):
+        university = schedules.setdefault(f"University {u}", {"degrees": {}})
+        for d in range(degrees):
+            degree = university["degrees"].setdefault(f"Degree {d}", {"groups": {}})
+            for g in range(groups):
+                degree["groups"][f"G{u}{d}-{g}"] = {
+                    day: {slot: [rng.choice(subjects), rng.choice(teachers), rng.choice(rooms)] for slot in rng.sample(slots, rng.randint(2, 5))}
+                    for day in DAYS
+                }
+    # Load through JSON like the stores do, so no strings are shared up front.
+    return json.loads(json.dumps(schedules))
+
+def measure(build):
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+def bench_schedules(file, groups):
+    """Compare the memory and day lookups of the schedules.json dicts and ScheduleModel."""
+    if file:
+        with open(file, 'r') as f:
+            text = f.read()
+    else:
+        text = json.dumps(synthetic_schedules(groups=groups))
+    load = lambda: json.loads(text)
+
+    schedules, dict_size = measure(load)
+    model, model_size = measure(lambda: ScheduleModel.from_schedules(load()))
+    if model.to_schedules() != schedules:
+        sys.exit("Round trip through ScheduleModel changed the schedules")
+
+    keys = model.group_keys()
+    started = time.perf_counter()
+    for university, degree, group in keys:
+        for day in DAYS:
+            schedules.get(university, {}).get("degrees", {}).get(degree, {}).get("groups", {}).get(group, {}).get(day)
+    dict_lookup = (time.perf_counter() - started) / (len(keys) * len(DAYS))
+    started = time.perf_counter()
+    for university, degree, group in keys:
+        for day in DAYS:
+            model.day(university, degree, group, day)
+    model_lookup = (time.perf_counter() - started) / (len(keys) * len(DAYS))
+
+    print(f"{len(keys)} groups, {len(model.lessons)} group days, {len(model.strings)} distinct strings")
+    print(f"dict form:    {dict_size / 1e6:.1f} MB, day lookup {dict_lookup * 1e6:.2f} us")
+    print(f"compact form: {model_size / 1e6:.1f} MB, day lookup {model_lookup * 1e6:.2f} us")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the bot's hot paths against their original versions.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    layout_parser = subparsers.add_parser('layout', help="Time the memoized timetable text layout.")
+    layout_parser.add_argument('--count', type=int, default=600, help="random lessons to lay out")
+    layout_parser.add_argument('--seed', type=int, default=1)
+    excel_parser = subparsers.add_parser('excel', help="Compare the timetable parsers on a large workbook.")
+    excel_parser.add_argument('--file', help="a timetable workbook to parse instead of synthetic data")
+    excel_parser.add_argument('--rows', type=int, default=10000, help="rows in the synthetic workbook")
+    excel_parser.add_argument('--numeric-groups', action='store_true', help="use numbers as the synthetic group names")
+    schedules_parser = subparsers.add_parser('schedules', help="Compare the memory of the dict and compact schedule forms.")
+    schedules_parser.add_argument('--file', help="a schedules.json to measure instead of synthetic data")
+    schedules_parser.add_argument('--groups', type=int, default=120, help="groups per degree in the synthetic data")
+    args = parser.parse_args()
+
+    if args.command == 'layout':
+        bench_layout(args.count, args.seed)
+    elif args.command == 'excel':
+        bench_excel(args.file, args.rows, args.numeric_groups)
+    elif args.command == 'schedules':
+        bench_schedules(args.file, args.groups)
@@ -0,0 +1,167 @@
+import json, os, threading, time, uuid
+from concurrent.futures import wait
+from media_cache import MediaCache, MediaSender
+
+BROADCASTS_DIR = 'broadcasts'
+
+
+def parse_audience(text):
+    """Parse "all" or "University|Degree|Group" (degree and group optional) into filters."""
+    if text.strip().lower() == 'all':
+        return {}
+    parts = [part.strip() or None for part in text.split('|')]
+    return dict(zip(('university', 'degree', 'group'), parts))
+
+def describe_audience(audience):
+    return " / ".join(value for value in audience.values() if value) or "all users"
+
+
+class Broadcast:
+    """A message, photo, document or animation sent to a fixed list of recipients.
+
+    The job itself is stored in `<id>.json` and every finished recipient is
+    appended to `<id>.progress`, so a restarted run skips exactly the users
+    that were already handled, including those skipped as inactive. `media` is a local path or a Telegram file_id;
+    a local file is uploaded once and its file_id reused for everyone else.
+    """
+
+    def __init__(self, broadcast_id, recipients, text, media=None, media_type='photo', audience=None, directory=BROADCASTS_DIR):
+        self.id = broadcast_id
+        self.recipients = [str(recipient) for recipient in recipients]
+        self.text = text
+        self.media = media
+        self.media_type = media_type
+        self.audience = audience or {}
+        self.directory = directory
+        self.sent = 0
+        self.failed = []
+        self.skipped = 0
+        self.done = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, recipients, text, media=None, media_type='photo', audience=None, directory=BROADCASTS_DIR):
+        broadcast = cls(time.strftime('%Y%m%d-%H%M%S-') + uuid.uuid4().hex[:6], recipients, text, media, media_type, audience, directory)
+        broadcast.save()
+        return broadcast
+
+    @classmethod
+    def load(cls, broadcast_id, directory=BROADCASTS_DIR):
+        with open(os.path.join(directory, f"{broadcast_id}.json"), 'r') as f:
+            job = json.load(f)
+        broadcast = cls(job['id'], job['recipients'], job['text'], job.get('media'), job.get('media_type', 'photo'), job.get('audience'), directory)
+        broadcast._load_progress()
+        return broadcast
+
+    @staticmethod
+    def unfinished(directory=BROADCASTS_DIR):
+        """Ids of the broadcasts that still have recipients left."""
+        if not os.path.isdir(directory):
+            return []
+        ids = []
+        for file_name in sorted(os.listdir(directory)):
+            if file_name.endswith('.json'):
+                broadcast = Broadcast.load(file_name[:-5], directory)
+                if broadcast.pending():
+                    ids.append(broadcast.id)
+        return ids
+
+    @property
+    def _job_file(self):
+        return os.path.join(self.directory, f"{self.id}.json")
+
+    @property
+    def _progress_file(self):
+        return os.path.join(self.directory, f"{self.id}.progress")
+
+    def save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        job = {'id': self.id, 'text': self.text, 'media': self.media, 'media_type': self.media_type, 'audience': self.audience, 'recipients': self.recipients}
+        with open(f"{self._job_file}.tmp", 'w') as f:
+            json.dump(job, f)
+        os.replace(f"{self._job_file}.tmp", self._job_file)
+
+    def _load_progress(self):
+        if not os.path.exists(self._progress_file):
+            return
+        with open(self._progress_file, 'r') as f:
+            for line in f:
+                chat_id, _, status = line.rstrip('\n').partition('\t')
+                if not status:
+                    continue  # torn last line from a crash, that user is sent again
+                self.done.add(chat_id)
+                if status == 'ok':
+                    self.sent += 1
+                elif status == 'skipped':
+                    self.skipped += 1
+                else:
+                    self.failed.append(chat_id)
+
+    def pending(self):
+        return [recipient for recipient in self.recipients if recipient not in self.done]
+
+    def _send(self, sender, chat_id):
+        if not self.media:
+            return sender.dispatcher.send_message(chat_id, self.text)
+        return sender.send(chat_id, self.media_type, self.media, self.text)
+
+    def run(self, dispatcher, progress=None, progress_interval=3.0, media_cache=None, pruner=None):
+        """Send to every pending recipient through `dispatcher`'s worker pool.
+
+        `progress(sent, failed, total)` is called at most every `progress_interval`
+        seconds and once at the end; `total` leaves out skipped users. With a
+        SubscriberPruner, users marked inactive are skipped and chats that turn
+        out dead are pruned.
+        """
+        pending = self.pending()
+        with open(self._progress_file, 'a') as log:
+            if pruner:
+                active = pruner.active(pending)
+                kept = set(active)
+                for chat_id in pending:
+                    if chat_id not in kept:
+                        log.write(f"{chat_id}\tskipped\n")
+                        self.done.add(chat_id)
+                        self.skipped += 1
+                log.flush()
+                pending = active
+            total = len(self.recipients) - self.skipped
+            last_report = 0.0
+            window = dispatcher.workers * 4
+            sender = MediaSender(dispatcher, media_cache or MediaCache())
+
+            def record(future):
+                # Log each send as soon as it finishes, so an interrupted run never repeats it
+                if future.cancelled() or future.exception():
+                    return
+                result = future.result()
+                with self._lock:
+                    log.write(f"{result.chat_id}\t{'ok' if result.ok else result.status_code}\n")
+                    log.flush()
+                    self.done.add(str(result.chat_id))
+                    if result.ok:
+                        self.sent += 1
+                    else:
+                        self.failed.append(str(result.chat_id))
+
+            for start in range(0, len(pending), window):
+                futures = [dispatcher.executor.submit(self._send, sender, chat_id) for chat_id in pending[start:start + window]]
+                for future in futures:
+                    future.add_done_callback(record)
+                try:
+                    results = [future.result() for future in futures]
+                except BaseException:
+                    # Drop the sends that have not started and let the running ones be logged
+                    for future in futures:
+                        future.cancel()
+                    wait(futures)
+                    raise
+                if pruner:
+                    pruner.record(results)
+                if progress and time.monotonic() - last_report >= progress_interval:
+                    last_report = time.monotonic()
+                    progress(self.sent, len(self.failed), total)
+
+        if progress:
+            progress(self.sent, len(self.failed), total)
+        return self.sent, self.failed
@@ -0,0 +1,97 @@
+import json, sqlite3, threading, time
+from collections import OrderedDict
+
+
+class ConversationStore:
+    """The pending next step of each chat's conversation.
+
+    A state is a step name plus the JSON-serializable arguments for it. States
+    expire after `ttl` seconds and at most `max_entries` are kept, evicting the
+    least recently updated ones. With `path` the states are also written to a
+    SQLite database, so conversations in progress survive a restart.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS conversations (
+            chat_id TEXT PRIMARY KEY,
+            step TEXT NOT NULL,
+            args TEXT NOT NULL,
+            expires REAL NOT NULL
+        )
+    """
+
+    def __init__(self, ttl=3600, max_entries=10000, path=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.states = OrderedDict()
+        self.stats = {'expired': 0, 'evicted': 0}
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute(self.SCHEMA)
+            self._db.execute('DELETE FROM conversations WHERE expires <= ?', (time.time(),))
+            for chat_id, step, args, expires in self._db.execute('SELECT chat_id, step, args, expires FROM conversations ORDER BY expires'):
+                self.states[chat_id] = (step, json.loads(args), expires)
+            self._evict()
+
+    def _evict(self):
+        """Drop expired states and the oldest ones above the size bound; the caller holds the lock."""
+        now = time.time()
+        removed = []
+        # States are kept in update order and share one TTL, so the expired ones are at the front.
+        while self.states:
+            chat_id, (_, _, expires) = next(iter(self.states.items()))
+            if expires > now:
+                break
+            self.states.popitem(last=False)
+            self.stats['expired'] += 1
+            removed.append(chat_id)
+        while len(self.states) > self.max_entries:
+            chat_id, _ = self.states.popitem(last=False)
+            self.stats['evicted'] += 1
+            removed.append(chat_id)
+        if removed and self._db:
+            self._db.executemany('DELETE FROM conversations WHERE chat_id = ?', [(chat_id,) for chat_id in removed])
+
+    def set(self, chat_id, step, args=()):
+        chat_id = str(chat_id)
+        expires = time.time() + self.ttl
+        with self._lock:
+            self.states[chat_id] = (step, list(args), expires)
+            self.states.move_to_end(chat_id)
+            if self._db:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO conversations (chat_id, step, args, expires) VALUES (?, ?, ?, ?)',
+                    (chat_id, step, json.dumps(list(args), ensure_ascii=False), expires),
+                )
+            self._evict()
+
+    def get(self, chat_id):
+        """Return the live (step, args) of a chat, or None."""
+        with self._lock:
+            state = self.states.get(str(chat_id))
+            if state is None:
+                return None
+            if state[2] <= time.time():
+                self._evict()
+                return None
+            return state[0], state[1]
+
+    def pop(self, chat_id):
+        with self._lock:
+            state = self.states.pop(str(chat_id), None)
+            if state is None:
+                return None
+            if self._db:
+                self._db.execute('DELETE FROM conversations WHERE chat_id = ?', (str(chat_id),))
+            if state[2] <= time.time():
+                self.stats['expired'] += 1
+                return None
+            return state[0], state[1]
+
+    def status(self):
+        with self._lock:
+            self._evict()
+            return {'live': len(self.states), **self.stats}
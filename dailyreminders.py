@@ -1,111 +1,95 @@
-import json, time, requests, os
-from datetime import datetime
 from environs import Env
-from requests.exceptions import RequestException
+from dispatcher import API_URL, Dispatcher
+from reminder_index import ReminderIndex
+from minute_scheduler import MinuteScheduler
+from render import ScheduleRenderer, render_empty_day_short
+from storage import open_store
+from repository import DataRepository
+from pruning import SubscriberPruner
 
 env = Env()
 env.read_env()
 
-users_data_file = 'users_data.json'
-schedules_file = 'schedules.json'
-schedule_times_file = 'schedule_times.json'
-url = f'https://api.telegram.org/bot{env("BOT_TOKEN")}/sendMessage'
-
-def load_data(file):
-    if not os.path.exists(file):
-        return {}
-    with open(file, 'r') as f:
-        return json.load(f)
-
-users_data = load_data(users_data_file)
-schedules = load_data(schedules_file)
-
-def send_message(chat_id, text, parse_mode="Markdown", retries=3):
-    payload = {
-        'chat_id': chat_id,
-        'text': text,
-        'parse_mode': parse_mode
-    }
-    attempt = 0
-    while attempt < retries:
-        try:
-            response = requests.post(url, json=payload, timeout=10)  # Added timeout to avoid hanging
-            if response.status_code == 200:
-                print(f"Message successfully sent to {chat_id}.")
-                return True
+scheduler_state_file = 'reminder_state.json'
+dispatcher = Dispatcher(
+    env("BOT_TOKEN"),
+    api_url=env("TELEGRAM_API_URL", API_URL),
+    workers=env.int("DISPATCH_WORKERS", 16),
+    rate=env.float("DISPATCH_RATE", 30),
+)
+
+repository = DataRepository(open_store(env))
+reminder_index = ReminderIndex(repository)
+pruner = SubscriberPruner(repository)
+renderer = ScheduleRenderer(lambda university, degree, group, day: repository.schedules.day(university, degree, group, day))
+repository.on_reload(lambda name: renderer.invalidate() if name == 'schedules' else None)
+
+def build_reminders(user_ids, today):
+    """Group the users by (group, weekday) and render each group's message once.
+
+    Returns the (chat_id, text) pairs to send and how many unique groups and
+    skipped empty days there were. Users without lessons today get the full
+    message, a one-line note or nothing, following their 'empty_days' preference.
+    """
+    users = repository.users
+    by_group = {}
+    messages = []
+    for user_id in user_ids:
+        info = users.get(str(user_id))
+        if not info:
+            messages.append((user_id, "User information not found."))
+            continue
+        key = (info.get('university', 'Unknown University'), info.get('degree', 'Unknown Degree'), info.get('group', 'Unknown Group'))
+        by_group.setdefault(key, []).append((user_id, info.get('empty_days', 'full')))
+
+    skipped = 0
+    for (university, degree, group), members in by_group.items():
+        text = renderer.render(university, degree, group, today)
+        empty = not repository.schedules.day(university, degree, group, today)
+        for user_id, empty_days in members:
+            if not empty or empty_days == 'full':
+                messages.append((user_id, text))
+            elif empty_days == 'short':
+                messages.append((user_id, render_empty_day_short(group, today)))
             else:
-                print(f"Failed to send message to {chat_id}. Response: {response.text}")
-        except RequestException as e:
-            print(f"Request error while sending message to {chat_id}: {e}")
-
-        attempt += 1
-        print(f"Retrying ({attempt}/{retries})...")
-        time.sleep(2)  # Wait 2 seconds before retrying
-
-    print(f"Failed to send message to {chat_id} after {retries} attempts.")
-    return False
-
-def get_schedule(user_id):
-    user_info = users_data.get(str(user_id), {})
-    if not user_info:
-        return "User information not found."
-
-    university = user_info.get('university', 'Unknown University')
-    degree = user_info.get('degree', 'Unknown Degree')
-    group = user_info.get('group', 'Unknown Group')
-    today = datetime.now().strftime('%A')
-
-    group_schedule = schedules.get(university, {}).get("degrees", {}).get(degree, {}).get("groups", {}).get(group, {}).get(today)
-    
-    if group_schedule:
-        schedule_message = f"📅 Schedule for *{today}*:\n\n"
-        schedule_message += f"🏫 University: *{university}*\n"
-        schedule_message += f"🎓 Degree: *{degree}*\n"
-        schedule_message += f"👥 Group: *{group}*\n\n"
-        schedule_message += "*Lessons:*\n"
-        
-        for time_slot, lesson_info in group_schedule.items():
-            schedule_message += f"🕒 *{time_slot}*\n"
-            schedule_message += f"📘 Subject: {lesson_info[0]}\n"
-            if len(lesson_info) > 1:
-                teacher_name = lesson_info[1].strip()
-                teacher_info = lesson_info[2].strip()
-                if teacher_info.lower() != "none":
-                    schedule_message += f"👤 Teacher: {teacher_name} ({teacher_info})\n"
-                else:
-                    schedule_message += f"👤 Teacher: {teacher_name}\n"
-            schedule_message += "\n"
-
-        return schedule_message
-    else:
-        return f"📅 Schedule for *{today}*:\n\n🏫 University: *{university}*\n🎓 Degree: *{degree}*\n👥 Group: *{group}*\n\nNo lessons scheduled for today."
+                skipped += 1
+    return messages, len(by_group), skipped
+
+def notify_minute(minute):
+    """Send the reminders of every user scheduled at the given minute in one dispatcher batch."""
+    now = minute.strftime('%H:%M')
+    today = minute.strftime('%A')
+
+    try:
+        if reminder_index.refresh():
+            print(f"Reloaded reminder times: {len(reminder_index)} users scheduled.")
+
+        user_ids = pruner.active(list(reminder_index.users_at(now)))
+        if not user_ids:
+            return
+        messages, groups, skipped = build_reminders(user_ids, today)
+        results = dispatcher.send_messages(messages)
+        failed = [result.chat_id for result in results if not result.ok]
+        pruned = pruner.record(results)
+        render_stats = renderer.stats()
+        print(f"Reminders for {now}: {len(user_ids)} users, {groups} unique groups, {len(results) - len(failed)}/{len(messages)} messages sent, {skipped} empty days skipped (schedule cache: {render_stats['hits']} hits, {render_stats['misses']} misses).")
+        if failed:
+            print(f"Failed to notify: {', '.join(failed)}")
+        if pruned:
+            print(f"Marked {pruned} users who blocked the bot or deleted the chat as inactive.")
+
+    except Exception as e:
+        print(f"An error occurred while checking notifications: {e}")
+
+def report_lag(stats):
+    if stats['last_lag'] >= 60:
+        print(f"Reminder lag: last {stats['last_lag']:.1f}s, avg {stats['avg_lag']:.1f}s, max {stats['max_lag']:.1f}s, {stats['buckets_skipped']} buckets skipped.")
 
 def check_notifications():
     """Check and send notifications based on the schedule times."""
     print("Starting notification service...")
-    while True:
-        now = datetime.now().strftime('%H:%M')
-        users_to_notify = []
-
-        try:
-            with open(schedule_times_file, 'r') as infile:
-                data = json.load(infile)
-
-            for user_id, notify_time in data.items():
-                if notify_time == now:
-                    users_to_notify.append(user_id)  # Collect users to notify.
-
-            for user_id in users_to_notify:
-                print(f"Sending schedule notification to user {user_id} at {now}.")
-                message = get_schedule(user_id)
-                send_message(user_id, message)
-
-        except FileNotFoundError:
-            print(f"File {schedule_times_file} not found.")
-        except Exception as e:
-            print(f"An error occurred while checking notifications: {e}")
-
-        time.sleep(60)
+    scheduler = MinuteScheduler(notify_minute, scheduler_state_file, max_catchup_minutes=env.int("REMINDER_MAX_CATCHUP", 60))
+    scheduler.run_forever(report_lag)
 
 if __name__ == '__main__':
     check_notifications()
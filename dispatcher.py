@@ -0,0 +1,243 @@
+import argparse, json, threading, time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
+
+API_URL = 'https://api.telegram.org'
+
+DeliveryResult = namedtuple('DeliveryResult', 'chat_id ok status_code description result attempts elapsed')
+
+# Chats that will never accept a message again: the user blocked the bot or
+# deleted their account, or the chat does not exist.
+PERMANENT_FAILURES = frozenset(['blocked', 'chat_not_found'])
+
+
+def classify(result):
+    """Sort a DeliveryResult into ok, blocked, chat_not_found, rate_limited, server_error, network_error or failed."""
+    if result.ok:
+        return 'ok'
+    if result.status_code is None:
+        return 'network_error'
+    if result.status_code == 403:
+        return 'blocked'
+    if result.status_code == 400 and 'chat not found' in (result.description or '').lower():
+        return 'chat_not_found'
+    if result.status_code == 429:
+        return 'rate_limited'
+    if result.status_code >= 500:
+        return 'server_error'
+    return 'failed'
+
+
+class TokenBucket:
+    """Blocking token bucket: `rate` tokens per second, bursting up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens / self.rate
+
+    def acquire(self):
+        if not self.rate:
+            return
+        delay = self._reserve()
+        if delay:
+            time.sleep(delay)
+
+
+class ChatLimiter:
+    """Spaces out consecutive messages to the same chat by `interval` seconds."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.next_allowed = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, chat_id):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if len(self.next_allowed) > 10000:
+                self.next_allowed = {chat: t for chat, t in self.next_allowed.items() if t > now}
+            slot = max(now, self.next_allowed.get(chat_id, 0))
+            self.next_allowed[chat_id] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class Dispatcher:
+    """Sends Bot API requests over a pooled keep-alive session from a bounded worker pool.
+
+    Throughput is capped by a global token bucket (Telegram allows ~30 msg/s) and
+    a per-chat interval, and 429 responses pause every worker for `retry_after`.
+    """
+
+    def __init__(self, token, api_url=API_URL, workers=16, rate=30, per_chat_interval=1.0, retries=3, timeout=10):
+        self.base_url = f"{api_url.rstrip('/')}/bot{token}"
+        self.workers = workers
+        self.retries = retries
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='dispatch')
+        self.bucket = TokenBucket(rate)
+        self.chat_limiter = ChatLimiter(per_chat_interval)
+        self._paused_until = 0.0
+        self._pause_lock = threading.Lock()
+
+    def _wait_for_pause(self):
+        delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _pause(self, seconds):
+        with self._pause_lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def call(self, method, chat_id, payload, files=None):
+        """Perform one API call for `chat_id`, retrying 429s, 5xx and network errors."""
+        started = time.monotonic()
+        status_code, description = None, None
+        attempt = 0
+        while attempt < self.retries:
+            attempt += 1
+            self._wait_for_pause()
+            self.chat_limiter.acquire(chat_id)
+            self.bucket.acquire()
+            try:
+                if files:
+                    for file in files.values():
+                        file.seek(0)  # a retry has to upload the whole file again
+                    response = self.session.post(f"{self.base_url}/{method}", data=payload, files=files, timeout=self.timeout)
+                else:
+                    response = self.session.post(f"{self.base_url}/{method}", json=payload, timeout=self.timeout)
+            except RequestException as e:
+                status_code, description = None, str(e)
+                print(f"Request error while calling {method} for {chat_id}: {e}")
+                time.sleep(2 ** (attempt - 1))
+                continue
+
+            try:
+                body = response.json()
+            except ValueError:
+                body = {}
+            status_code = response.status_code
+            description = body.get('description', response.text)
+
+            if status_code == 200:
+                return DeliveryResult(chat_id, True, status_code, description, body.get('result'), attempt, time.monotonic() - started)
+            if status_code == 429:
+                retry_after = body.get('parameters', {}).get('retry_after', 1)
+                print(f"Rate limited while sending to {chat_id}, retrying after {retry_after}s.")
+                self._pause(retry_after)
+                continue
+            if status_code >= 500:
+                print(f"Server error {status_code} while sending to {chat_id}, retrying ({attempt}/{self.retries})...")
+                time.sleep(2 ** (attempt - 1))
+                continue
+            break
+
+        print(f"Failed to send message to {chat_id}. Response: {status_code} {description}")
+        return DeliveryResult(chat_id, False, status_code, description, None, attempt, time.monotonic() - started)
+
+    def send_message(self, chat_id, text, parse_mode="Markdown"):
+        payload = {'chat_id': chat_id, 'text': text}
+        if parse_mode:
+            payload['parse_mode'] = parse_mode
+        return self.call('sendMessage', chat_id, payload)
+
+    def submit(self, method, chat_id, payload, files=None):
+        return self.executor.submit(self.call, method, chat_id, payload, files)
+
+    def send_messages(self, messages, parse_mode="Markdown"):
+        """Send `(chat_id, text)` pairs concurrently and return their results in order."""
+        futures = [self.executor.submit(self.send_message, chat_id, text, parse_mode) for chat_id, text in messages]
+        return [future.result() for future in futures]
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.session.close()
+
+
+class StubBotAPIHandler(BaseHTTPRequestHandler):
+    """Answers every Bot API method with a successful, empty message result."""
+    latency = 0.0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.latency:
+            time.sleep(self.latency)
+        body = json.dumps({'ok': True, 'result': {'message_id': 1, 'date': int(time.time())}}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(port=0, latency=0.0):
+    handler = type('StubHandler', (StubBotAPIHandler,), {'latency': latency})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def benchmark(count, workers, rate, latency):
+    server = start_stub_server(latency=latency)
+    api_url = f"http://127.0.0.1:{server.server_address[1]}"
+    dispatcher = Dispatcher('stub', api_url=api_url, workers=workers, rate=rate, per_chat_interval=0)
+    started = time.monotonic()
+    results = dispatcher.send_messages((chat_id, "Benchmark message") for chat_id in range(count))
+    elapsed = time.monotonic() - started
+    dispatcher.close()
+    server.shutdown()
+    sent = sum(result.ok for result in results)
+    print(f"Sent {sent}/{count} messages in {elapsed:.2f}s ({sent / elapsed:.1f} msg/s, {workers} workers, rate limit {rate or 'off'}).")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Bot API dispatcher utilities.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    stub_parser = subparsers.add_parser('stub', help="Run a local stub of the Bot API.")
+    stub_parser.add_argument('--port', type=int, default=8081)
+    stub_parser.add_argument('--latency', type=float, default=0.0)
+    bench_parser = subparsers.add_parser('bench', help="Benchmark dispatch throughput against the stub.")
+    bench_parser.add_argument('--count', type=int, default=1000)
+    bench_parser.add_argument('--workers', type=int, default=16)
+    bench_parser.add_argument('--rate', type=float, default=0, help="Global msg/s limit, 0 disables it.")
+    bench_parser.add_argument('--latency', type=float, default=0.05)
+    args = parser.parse_args()
+
+    if args.command == 'stub':
+        server = start_stub_server(args.port, args.latency)
+        print(f"Stub Bot API listening on http://127.0.0.1:{server.server_address[1]}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.shutdown()
+    else:
+        benchmark(args.count, args.workers, args.rate, args.latency)
@@ -0,0 +1,112 @@
+import io
+import pandas as pd
+from openpyxl import load_workbook
+
+SCHEDULE_SHEET = 'Лист1'
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+COLUMNS = ['Groups', 'Time'] + DAYS
+# Cell strings that pandas.read_excel turns into NaN by default.
+NA_VALUES = frozenset([
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+])
+
+
+def clean_column(column):
+    """Strip leading and trailing whitespace and newlines from the string values of a column."""
+    if column.dtype != object:
+        return column
+    return column.str.strip().fillna(column)
+
+def parse_sheet(sheet_data):
+    """Build the group -> day -> time slot -> lesson info dict from a timetable DataFrame."""
+    frame = pd.DataFrame({
+        'row': range(len(sheet_data)),
+        # object arrays keep numeric group names and times as Python ints and
+        # floats, so the result is JSON serializable like the old parser's
+        'group': clean_column(sheet_data['Groups']).to_numpy(dtype=object),
+        'time': clean_column(sheet_data['Time']).to_numpy(dtype=object),
+    })
+    for day in DAYS:
+        frame[day] = sheet_data[day].to_numpy()
+    frame = frame[frame['group'].notna() & frame['time'].notna()]
+
+    parsed_schedule = {group: {} for group in frame['group'].unique()}
+
+    lessons = frame.melt(id_vars=['row', 'group', 'time'], value_vars=DAYS, var_name='day', value_name='lesson')
+    lessons = lessons[lessons['lesson'].notna()]
+    if lessons.empty:
+        return parsed_schedule
+
+    # Split and clean each lesson entry: "a , b" -> ["a", "b"]
+    split_lessons = lessons['lesson'].str.strip().str.split(r'\s*,\s*', regex=True)
+    if split_lessons.isna().any():
+        bad_value = lessons['lesson'][split_lessons.isna()].iloc[0]
+        raise TypeError(f"Lesson cells must contain text, got {bad_value!r}")
+    lessons = lessons.assign(
+        lesson=split_lessons,
+        day_index=lessons['day'].map({day: index for index, day in enumerate(DAYS)}),
+    ).sort_values(['row', 'day_index'], kind='stable')
+
+    for group, group_lessons in lessons.groupby('group', sort=False):
+        days = parsed_schedule[group]
+        for day, time_slot, lesson_info in zip(group_lessons['day'].tolist(), group_lessons['time'].tolist(), group_lessons['lesson'].tolist()):
+            days.setdefault(day, {})[time_slot] = lesson_info
+
+    return parsed_schedule
+
+def clean_text(text):
+    """Removes leading and trailing whitespace and newlines."""
+    return text.strip() if isinstance(text, str) else text
+
+def _cell(row, index):
+    value = row[index] if index < len(row) else None
+    if isinstance(value, str) and value in NA_VALUES:
+        return None
+    return value
+
+def stream_excel_to_json(source, sheet_name=SCHEDULE_SHEET, progress=None, progress_every=1000):
+    """Parse a timetable workbook row by row with openpyxl in read-only mode.
+
+    `source` is a path or the raw bytes of the workbook. Memory use stays
+    constant apart from the resulting dict. `progress(rows_done, total_rows)`
+    is called every `progress_every` rows; `total_rows` may be None.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        if sheet_name not in workbook.sheetnames:
+            raise ValueError(f"Worksheet named '{sheet_name}' not found")
+        sheet = workbook[sheet_name]
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, ())
+        columns = {}
+        for index, name in enumerate(header):
+            columns.setdefault(name, index)
+        missing = [name for name in COLUMNS if name not in columns]
+        if missing:
+            raise ValueError(f"Missing columns in '{sheet_name}': {', '.join(missing)}")
+
+        group_index, time_index = columns['Groups'], columns['Time']
+        day_indexes = [(day, columns[day]) for day in DAYS]
+        total_rows = sheet.max_row - 1 if sheet.max_row else None
+
+        parsed_schedule = {}
+        rows_done = 0
+        for rows_done, row in enumerate(rows, 1):
+            group = clean_text(_cell(row, group_index))
+            time_slot = clean_text(_cell(row, time_index))
+            if group is not None and time_slot is not None:
+                days = parsed_schedule.setdefault(group, {})
+                for day, day_index in day_indexes:
+                    lesson_info = _cell(row, day_index)
+                    if lesson_info is not None:
+                        days.setdefault(day, {})[time_slot] = [clean_text(info) for info in lesson_info.split(',')]
+            if progress and rows_done % progress_every == 0:
+                progress(rows_done, total_rows)
+        if progress and rows_done % progress_every:
+            progress(rows_done, total_rows)
+        return parsed_schedule
+    finally:
+        workbook.close()
@@ -0,0 +1,100 @@
+import hashlib, json, os, threading
+from collections import OrderedDict
+
+
+class WeeklyImageCache:
+    """Content-addressed cache of weekly timetable PNGs.
+
+    Images live in a small in-memory LRU backed by `cache_dir` on disk, and the
+    Telegram `file_id` of every uploaded image is remembered so repeat requests
+    can be answered without rendering or uploading again.
+    """
+
+    def __init__(self, cache_dir, file_ids_file, max_entries=64):
+        self.cache_dir = cache_dir
+        self.file_ids_file = file_ids_file
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+        self.file_ids = self._load_file_ids()
+        self.stats = {'file_id_hits': 0, 'memory_hits': 0, 'disk_hits': 0, 'renders': 0}
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _load_file_ids(self):
+        if not os.path.exists(self.file_ids_file):
+            return {}
+        with open(self.file_ids_file, 'r') as f:
+            return json.load(f)
+
+    def _save_file_ids(self):
+        temp_file = f"{self.file_ids_file}.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump(self.file_ids, f)
+        os.replace(temp_file, self.file_ids_file)
+
+    @staticmethod
+    def key(university, degree, group, weekly_schedule):
+        content = json.dumps([university, degree, group, weekly_schedule], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.png")
+
+    def get_file_id(self, key):
+        with self._lock:
+            file_id = self.file_ids.get(key)
+            if file_id:
+                self.stats['file_id_hits'] += 1
+            return file_id
+
+    def set_file_id(self, key, file_id):
+        with self._lock:
+            self.file_ids[key] = file_id
+            self._save_file_ids()
+
+    def forget_file_id(self, key):
+        with self._lock:
+            if self.file_ids.pop(key, None):
+                self._save_file_ids()
+
+    def _remember(self, key, data):
+        self.memory[key] = data
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def get_png(self, key):
+        with self._lock:
+            data = self.memory.get(key)
+            if data is not None:
+                self.memory.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return data
+
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            data = f.read()
+        with self._lock:
+            self._remember(key, data)
+            self.stats['disk_hits'] += 1
+        return data
+
+    def put_png(self, key, data):
+        temp_path = f"{self._path(key)}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, self._path(key))
+        with self._lock:
+            self._remember(key, data)
+
+    def get_or_render(self, key, render):
+        """Return the cached PNG for `key`, calling `render()` for its bytes on a miss."""
+        data = self.get_png(key)
+        if data is None:
+            data = render()
+            with self._lock:
+                self.stats['renders'] += 1
+            self.put_png(key, data)
+        return data
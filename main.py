@@ -1,8 +1,21 @@
-import telebot, re, json, os, io
+import telebot, re, sqlite3, threading, time
 from datetime import datetime, timedelta
 from environs import Env
-import pandas as pd
-from PIL import Image, ImageDraw, ImageFont
+from reminder_index import ReminderIndex
+from render import EMPTY_DAY_MODES, ScheduleRenderer
+from image_cache import WeeklyImageCache
+from render_service import RenderQueueFull, RenderService
+from storage import is_active, open_store
+from repository import DataRepository
+from excel_import import SCHEDULE_SHEET, stream_excel_to_json
+from schedule_diff import affected_groups, apply_changes, diff_groups, log_changes, new_groups, summarize_changes
+from dispatcher import API_URL, Dispatcher
+from broadcast import Broadcast, describe_audience, parse_audience
+from pruning import SubscriberPruner
+from webhook import run_webhook
+from conversations import ConversationStore
+from navigation import NavigationIndex
+from subscribers import SubscriberIndex
 
 env = Env()
 env.read_env()
@@ -10,34 +23,55 @@ env.read_env()
 API_TOKEN = env("BOT_TOKEN")
 ADMINS: list[int] = [1064331548, 1274378031]
 
-SCHEDULES_FILE = 'schedules.json'
-USERS_DATA_FILE = 'users_data.json'
-SCHEDULE_TIMES_FILE = "schedule_times.json"
+WEEKLY_IMAGES_DIR = 'weekly_images'
+WEEKLY_FILE_IDS_FILE = 'weekly_file_ids.json'
+SCHEDULE_CHANGES_FILE = 'schedule_changes.jsonl'
+EMPTY_DAY_LABELS = {'full': "Full message", 'short': "Short note", 'skip': "No message"}
 
 bot = telebot.TeleBot(API_TOKEN)
 
-def load_data(file):
-    if not os.path.exists(file):
-        return {}
-    with open(file, 'r') as f:
-        return json.load(f)
-
-def save_data(file, data):
-    with open(file, 'w') as f:
-        json.dump(data, f, indent=4)
-
-schedules = load_data(SCHEDULES_FILE)
-users_data = load_data(USERS_DATA_FILE)
+store = open_store(env)
+repository = DataRepository(store)
+reminder_index = ReminderIndex(repository)
+reminder_index.refresh()
+subscribers = SubscriberIndex(repository)
+renderer = ScheduleRenderer(lambda university, degree, group, day: repository.schedules.day(university, degree, group, day))
+repository.on_reload(lambda name: renderer.invalidate() if name == 'schedules' else None)
+weekly_images = WeeklyImageCache(WEEKLY_IMAGES_DIR, WEEKLY_FILE_IDS_FILE)
+dispatcher = Dispatcher(API_TOKEN, api_url=env("TELEGRAM_API_URL", API_URL), workers=env.int("DISPATCH_WORKERS", 16), rate=env.float("DISPATCH_RATE", 30))
+pruner = SubscriberPruner(repository)
+render_service = RenderService(workers=env.int("RENDER_WORKERS", 0) or None, max_pending=env.int("RENDER_QUEUE_SIZE", 0) or None)
+navigation = NavigationIndex(repository, page_size=env.int("MENU_PAGE_SIZE", 40))
+conversations = ConversationStore(ttl=env.int("CONVERSATION_TTL", 3600), max_entries=env.int("CONVERSATION_MAX", 10000), path=env("CONVERSATION_DB", None))
+# Conversation steps by name, so a pending step can be stored outside the process.
+CONVERSATION_STEPS = {}
+
+def conversation_step(handler):
+    CONVERSATION_STEPS[handler.__name__] = handler
+    return handler
+
+def expect_reply(message, handler, *args):
+    """Handle the chat's next message with `handler(message, *args)`; args must be JSON-serializable."""
+    conversations.set(message.chat.id, handler.__name__, args)
 
 def save_user_info(user_id, first_name, username, university, degree, group):
-    users_data[user_id] = {
+    info = {
         'first_name': first_name,
         'username': username,
         'university': university,
         'degree': degree,
         'group': group
     }
-    save_data(USERS_DATA_FILE, users_data)
+    empty_days = repository.users.get(str(user_id), {}).get('empty_days')
+    if empty_days:
+        info['empty_days'] = empty_days
+    save_user(user_id, info)
+
+def save_user(user_id, info):
+    subscribers.refresh()
+    repository.save_user(user_id, info)
+    subscribers.update_user(user_id, info)
+    subscribers.mark_saved()
 
 def clean_markdown(text):
     escape_chars = '_{}[]()#+-.!>'
@@ -58,14 +92,21 @@ def clean_markdown(text):
     
     return cleaned_text
 
+# Registered before every other handler so a pending step gets the next message, commands included.
+@bot.message_handler(func=lambda message: conversations.get(message.chat.id) is not None, content_types=telebot.util.content_type_media)
+def continue_conversation(message):
+    state = conversations.pop(message.chat.id)
+    if state is not None:
+        step, args = state
+        CONVERSATION_STEPS[step](message, *args)
+
 @bot.message_handler(commands=['start'])
 def start(message):
-    global schedules
-    schedules = load_data(SCHEDULES_FILE)
-    users_data = load_data(USERS_DATA_FILE)
     user_name = message.from_user.first_name
     user_id = str(message.chat.id)
-    if user_id in users_data:
+    if user_id in repository.users:
+        if not is_active(repository.users[user_id]):
+            save_user(user_id, {key: value for key, value in repository.users[user_id].items() if key != 'active'})
         bot.send_message(message.chat.id, f"Welcome back, {user_name}! Use /schedule to view your group's schedule or type / to see available options.", reply_markup=telebot.types.ReplyKeyboardRemove())
     else:
         bot.send_message(message.chat.id, f"Welcome {user_name}! Please select your university.")
@@ -75,45 +116,39 @@ def start(message):
 def count(message):
     user_id = message.from_user.id
     if user_id in ADMINS:
-        users_data = load_data(USERS_DATA_FILE)
-        schedules = load_data(SCHEDULE_TIMES_FILE)
-        bot.send_message(message.chat.id, f"Total users registered: {len(users_data)}\nTotal users scheduled: {len(schedules)}")
+        if message.text.split()[1:] == ['groups']:
+            send_group_breakdown(message.chat.id)
+            return
+        reminder_index.refresh()
+        render_stats = renderer.stats()
+        conversation_stats = conversations.status()
+        bot.send_message(message.chat.id, f"Total users registered: {len(repository.users)}\nTotal users scheduled: {len(reminder_index)}\nSchedule cache: {render_stats['hits']} hits, {render_stats['misses']} misses\n{store.status()}\n{pruner.report()}\nConversations: {conversation_stats['live']} live, {conversation_stats['expired']} expired, {conversation_stats['evicted']} evicted\nActive users: {len(subscribers)} (/count groups for a per-group breakdown)")
+
+def send_group_breakdown(chat_id, limit=4000):
+    lines = [f"{university} / {degree} / {group}: {users} users, {scheduled} with reminders" for university, degree, group, users, scheduled in subscribers.breakdown()]
+    text = ""
+    for line in lines or ["No active users."]:
+        if len(text) + len(line) + 1 > limit:
+            bot.send_message(chat_id, text)
+            text = ""
+        text += line + "\n"
+    bot.send_message(chat_id, text)
+
 @bot.message_handler(commands=['schedule'])
 def get_schedule(message):
     user_id = str(message.chat.id)
-    if user_id not in users_data:
+    user_info = repository.users.get(user_id)
+    if user_info is None:
         bot.send_message(message.chat.id, "You are not registered yet. Use /start to register.")
         return
-    
-    user_info = users_data[user_id]
+
     university = user_info['university']
     degree = user_info['degree']
     group = user_info['group']
     today = datetime.now().strftime('%A')
-    
-    group_schedule = schedules.get(university, {}).get("degrees", {}).get(degree, {}).get("groups", {}).get(group, {}).get(today)
-    
-    if group_schedule:
-        schedule_message = f"📅 Schedule for *{today}*:\n\n"
-        schedule_message += f"🏫 University: *{university}*\n"
-        schedule_message += f"🎓 Degree: *{degree}*\n"
-        schedule_message += f"👥 Group: *{group}*\n\n"
-        schedule_message += "*Lessons:*\n"
-        
-        for time_slot, lesson_info in group_schedule.items():
-            schedule_message += f"🕒 *{time_slot}*\n"
-            schedule_message += f"📘 Subject: {lesson_info[0]}\n"
-            if len(lesson_info) > 1:
-                if lesson_info[2].strip().lower() == "none":
-                    schedule_message += f"👤 Teacher: {lesson_info[1].strip()}\n"
-                else:
-                    schedule_message += f"👤 Teacher: {lesson_info[1].strip()} ({lesson_info[2].strip()})\n"
 
-            schedule_message += "\n"
-        
-        bot.send_message(message.chat.id, schedule_message, parse_mode="Markdown")
-    else:
-        return f"📅 Schedule for *{today}*:\n\n🏫 University: *{university}*\n🎓 Degree: *{degree}*\n👥 Group: *{group}*\n\nNo lessons scheduled for today."
+    schedule_message = renderer.render(university, degree, group, today)
+    bot.send_message(message.chat.id, schedule_message, parse_mode="Markdown")
 
 @bot.message_handler(commands=["change_group"])
 def change_group(message):
@@ -127,8 +162,9 @@ def contact_admin(message):
     back_btn = telebot.types.KeyboardButton(text="Back ⬅️")
     markup.add(back_btn)
     bot.send_message(message.chat.id, "Please write your message to Admins:", reply_markup=markup)
-    bot.register_next_step_handler(message, feedback)
+    expect_reply(message, feedback)
 
+@conversation_step
 def feedback(message):
     user_id = message.from_user.id
     user_identifier = message.from_user.username or message.from_user.first_name or "Unknown User"
@@ -215,8 +251,8 @@ def handle_replies(message):
 @bot.message_handler(commands=["daily_reminder"])
 def daily_reminder(message):
     user_id = message.from_user.id
-    daily_reminders = load_data(SCHEDULE_TIMES_FILE)
-    user_schedule = daily_reminders.get(f"{user_id}")
+    reminder_index.refresh()
+    user_schedule = reminder_index.get(user_id)
     if user_schedule:
         markup = telebot.types.InlineKeyboardMarkup(row_width=2)
         renew_schedule = telebot.types.InlineKeyboardButton(text="New schedule 🆕", callback_data="renew_schedule")
@@ -234,8 +270,9 @@ def ask_schedule(message, user_id):
     markup = telebot.types.ReplyKeyboardMarkup(resize_keyboard=True)
     markup.add(back_btn)
     bot.send_message(user_id, "Please enter your scheduled time (HH:MM) format\nLike 09:00 or 18:00:", reply_markup=markup)
-    bot.register_next_step_handler(message, handle_schedule, user_id)
+    expect_reply(message, handle_schedule, user_id)
 
+@conversation_step
 def handle_schedule(message, user_id):
     user_id = message.from_user.id
     if message.text != "Back ⬅️":
@@ -245,9 +282,13 @@ def handle_schedule(message, user_id):
             ask_schedule(message, user_id)
         else:
             try:
-                daily_reminders = dict(load_data(SCHEDULE_TIMES_FILE))
-                daily_reminders[str(user_id)] = schedule_time
-                save_data(SCHEDULE_TIMES_FILE, daily_reminders)
+                reminder_index.refresh()
+                subscribers.refresh()
+                reminder_index.set(user_id, schedule_time)
+                repository.set_reminder(user_id, schedule_time)
+                reminder_index.mark_saved()
+                subscribers.set_reminder(user_id, schedule_time)
+                subscribers.mark_saved()
                 bot.send_message(message.chat.id, f"The schedule has been set for {schedule_time}.\nYou will receive a daily notifications at {schedule_time}.")
             except:
                 bot.send_message(message.chat.id, f"Failed to save the schedule at {schedule_time}. Please try again.")
@@ -261,25 +302,48 @@ def callback_query(call):
     bot.delete_message(chat_id=call.message.chat.id, message_id=call.message.message_id)
 
     if call.data == "remove_schedule":
-        remove_schedule(str(user_id), SCHEDULE_TIMES_FILE)
+        remove_schedule(str(user_id))
         bot.send_message(user_id, "Your daily schedule has been deleted successfully.")
     elif call.data == "renew_schedule":
         ask_schedule(call.message, user_id)
     elif call.data == "back":
         start(call.message)
+    elif call.data.startswith("empty_days:"):
+        set_empty_days(call.message, call.data.split(":", 1)[1])
 
-def remove_schedule(user_id, file_path):
-    try:
+@bot.message_handler(commands=["empty_days"])
+def empty_days(message):
+    user_info = repository.users.get(str(message.chat.id))
+    if user_info is None:
+        bot.send_message(message.chat.id, "You are not registered yet. Use /start to register.")
+        return
+    markup = telebot.types.InlineKeyboardMarkup(row_width=3)
+    markup.add(*[telebot.types.InlineKeyboardButton(text=EMPTY_DAY_LABELS[mode], callback_data=f"empty_days:{mode}") for mode in EMPTY_DAY_MODES])
+    current = EMPTY_DAY_LABELS[user_info.get('empty_days', 'full')]
+    bot.send_message(message.chat.id, f"What should your daily reminder say on days without lessons?\nCurrently: {current}", reply_markup=markup)
 
-        data = load_data(SCHEDULE_TIMES_FILE)        
-        if user_id in data:
-            del data[user_id]
-            save_data(SCHEDULE_TIMES_FILE, data)            
+def set_empty_days(message, mode):
+    user_id = str(message.chat.id)
+    user_info = repository.users.get(user_id)
+    if user_info is None or mode not in EMPTY_DAY_MODES:
+        return
+    save_user(user_id, {**user_info, 'empty_days': mode})
+    bot.send_message(message.chat.id, f"Saved. On days without lessons your reminder will be: {EMPTY_DAY_LABELS[mode]}.")
+
+def remove_schedule(user_id):
+    try:
+        reminder_index.refresh()
+        subscribers.refresh()
+        if reminder_index.remove(user_id):
+            repository.remove_reminder(user_id)
+            reminder_index.mark_saved()
+            subscribers.remove_reminder(user_id)
+            subscribers.mark_saved()
             print(f"Removed schedule for user {user_id}")
         else:
             print(f"No schedule found for user {user_id}")
 
-    except (FileNotFoundError, json.JSONDecodeError) as e:
+    except (OSError, ValueError, sqlite3.Error) as e:
         print(f"Error removing schedule: {e}")
 
 @bot.message_handler(commands=['addschedule'])
@@ -289,18 +353,21 @@ def request_university_degree(message):
         bot.send_message(user_id, "You don't have permission to add a schedule. Please contact with the admins")
         return
     bot.send_message(user_id, "Please enter the university name:")
-    bot.register_next_step_handler(message, handle_university_name)
+    expect_reply(message, handle_university_name)
 
+@conversation_step
 def handle_university_name(message):
     university = message.text
     bot.send_message(message.chat.id, "Please enter the degree:")
-    bot.register_next_step_handler(message, handle_degree, university)
+    expect_reply(message, handle_degree, university)
 
+@conversation_step
 def handle_degree(message, university):
     degree = message.text
     bot.send_message(message.chat.id, "Please upload the Excel file containing the schedule.")
-    bot.register_next_step_handler(message, process_excel_file, university, degree)
+    expect_reply(message, process_excel_file, university, degree)
 
+@conversation_step
 def process_excel_file(message, university, degree):
     if message.content_type != 'document':
         bot.send_message(message.chat.id, "Please upload a valid Excel file.")
@@ -309,121 +376,120 @@ def process_excel_file(message, university, degree):
     file_info = bot.get_file(message.document.file_id)
     downloaded_file = bot.download_file(file_info.file_path)
 
-    with open('temp_schedule.xlsx', 'wb') as new_file:
-        new_file.write(downloaded_file)
-    
-    schedule_json = parse_excel_to_json('temp_schedule.xlsx')
+    progress_message = bot.send_message(message.chat.id, "Reading the schedule...")
+    last_report = [time.monotonic()]
+
+    def report_progress(rows_done, total_rows):
+        if time.monotonic() - last_report[0] < 2:
+            return
+        last_report[0] = time.monotonic()
+        total = f"/{total_rows}" if total_rows else ""
+        try:
+            bot.edit_message_text(f"Reading the schedule: {rows_done}{total} rows...", message.chat.id, progress_message.message_id)
+        except telebot.apihelper.ApiTelegramException as e:
+            print(f"Could not update the import progress: {e}")
 
+    try:
+        schedule_json = stream_excel_to_json(downloaded_file, env("SCHEDULE_SHEET", SCHEDULE_SHEET), progress=report_progress)
+    except Exception as e:
+        bot.send_message(message.chat.id, f"Could not read the Excel file: {e}")
+        return
+
+    bot.edit_message_text(f"Read {len(schedule_json)} groups from the schedule.", message.chat.id, progress_message.message_id)
+    stored_groups = stored_degree_groups(university, degree)
+    changes = diff_groups(stored_groups, schedule_json)
+    bot.send_message(message.chat.id, summarize_changes(changes, new_groups(stored_groups, schedule_json)))
     bot.send_message(message.chat.id, "If you approve, reply with 'approve'. To reject, reply with 'reject'.")
     
-    bot.register_next_step_handler(message, handle_approval, university, degree, schedule_json)
+    expect_reply(message, handle_approval, university, degree, schedule_json)
+
+def stored_degree_groups(university, degree):
+    return repository.schedules.degree_groups(university, degree)
 
+@conversation_step
 def handle_approval(message, university, degree, schedule_json):
     if message.text.lower() == 'approve':
-        if university not in schedules:
-            schedules[university] = {"degrees": {}}
-        if degree not in schedules[university]["degrees"]:
-            schedules[university]["degrees"][degree] = {"groups": {}}
-
-        for group, days in schedule_json.items():
-            schedules[university]["degrees"][degree]["groups"][group] = days
-        
-        save_data(SCHEDULES_FILE, schedules)
-        bot.send_message(message.chat.id, "The schedule has been successfully added.")
+        stored_groups = stored_degree_groups(university, degree)
+        changes = diff_groups(stored_groups, schedule_json)
+        changed_groups = affected_groups(changes)
+        touched_groups = list(dict.fromkeys(changed_groups + new_groups(stored_groups, schedule_json)))
+
+        updated_groups = {group: dict(stored_groups.get(group, {})) for group in touched_groups}
+        apply_changes(updated_groups, schedule_json, changes)
+        repository.replace_groups(university, degree, updated_groups)
+        for group in changed_groups:
+            renderer.invalidate_group(university, degree, group)
+        if changes:
+            log_changes(SCHEDULE_CHANGES_FILE, university, degree, changes)
+
+        notified = notify_schedule_change(university, degree, changed_groups)
+        bot.send_message(message.chat.id, f"The schedule has been successfully added.\n{len(changes)} lessons changed in {len(changed_groups)} groups, notifying {notified} users.")
     else:
         bot.send_message(message.chat.id, "The schedule was not added.")
 
-def parse_excel_to_json(file_path):
-    excel_data = pd.read_excel(file_path, sheet_name=None)
-    sheet_data = excel_data['Лист1']  # Assuming sheet name is 'Лист1'
-    
-    def clean_text(text):
-        """Removes leading and trailing whitespace and newlines."""
-        return text.strip() if isinstance(text, str) else text
-
-    parsed_schedule = {}
-    for index, row in sheet_data.iterrows():
-        group = clean_text(row['Groups'])
-        time_slot = clean_text(row['Time'])
-        
-        if pd.notna(group) and pd.notna(time_slot):
-            if group not in parsed_schedule:
-                parsed_schedule[group] = {}
-            for day in ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']:
-                lesson_info = row[day]
-                if pd.notna(lesson_info):
-                    if day not in parsed_schedule[group]:
-                        parsed_schedule[group][day] = {}
-                    # Split and clean each lesson entry
-                    cleaned_lesson_info = [clean_text(info) for info in lesson_info.split(',')]
-                    parsed_schedule[group][day][time_slot] = cleaned_lesson_info
-
-    return parsed_schedule
-
-def show_universities(message):
-    back_btn = telebot.types.KeyboardButton(text="Back ⬅️")
-    markup = telebot.types.ReplyKeyboardMarkup(one_time_keyboard=True, row_width=2, resize_keyboard=True)
-    universities = list(schedules.keys())
-    buttons = [telebot.types.KeyboardButton(university) for university in universities]
-    
-    markup.add(*buttons)
-    markup.add(back_btn)
-    bot.send_message(message.chat.id, "Select your university:", reply_markup=markup)
-    bot.register_next_step_handler(message, handle_university_selection)
+def notify_schedule_change(university, degree, groups):
+    """Tell the users of the changed groups, returning how many were notified."""
+    users = subscribers.users_in_groups(university, degree, groups)
+    for user_id in users:
+        text = f"📢 The timetable of your group {repository.users[user_id]['group']} has changed. Use /schedule or /weekly to see the update."
+        dispatcher.submit('sendMessage', user_id, {'chat_id': user_id, 'text': text})
+    return len(users)
+
+def show_universities(message, page=0):
+    bot.send_message(message.chat.id, "Select your university:", reply_markup=navigation.keyboard((), page))
+    expect_reply(message, handle_university_selection, page)
 
-def handle_university_selection(message):
+@conversation_step
+def handle_university_selection(message, page=0):
     selected_university = message.text
     if selected_university != "Back ⬅️":
-        if selected_university in schedules:
+        next_page = navigation.turn_page(selected_university, page)
+        if next_page is not None:
+            show_universities(message, next_page)
+        elif navigation.has_option((), selected_university):
             user_data = {"university": selected_university}
             show_degrees(message, selected_university, user_data)
         else:
             bot.send_message(message.chat.id, "Invalid university. Please select again.")
-            show_universities(message)
+            show_universities(message, page)
     else:
         start(message)
 
-def show_degrees(message, university, user_data):
-    back_btn = telebot.types.KeyboardButton(text="Back ⬅️")
-    markup = telebot.types.ReplyKeyboardMarkup(one_time_keyboard=True, row_width=2, resize_keyboard=True)
-    degrees = list(schedules[university]["degrees"].keys())
-    buttons = [telebot.types.KeyboardButton(degree) for degree in degrees]
-    markup.add(*buttons)
-    markup.add(back_btn)
-
-    bot.send_message(message.chat.id, "Select your degree:", reply_markup=markup)
-    bot.register_next_step_handler(message, handle_degree_selection, user_data)
+def show_degrees(message, university, user_data, page=0):
+    bot.send_message(message.chat.id, "Select your degree:", reply_markup=navigation.keyboard((university,), page))
+    expect_reply(message, handle_degree_selection, user_data, page)
 
-def handle_degree_selection(message, user_data):
+@conversation_step
+def handle_degree_selection(message, user_data, page=0):
     selected_degree = message.text
     university = user_data["university"]
     if selected_degree!= "Back ⬅️":
-        if selected_degree in schedules[university]["degrees"]:
+        next_page = navigation.turn_page(selected_degree, page)
+        if next_page is not None:
+            show_degrees(message, university, user_data, next_page)
+        elif navigation.has_option((university,), selected_degree):
             user_data["degree"] = selected_degree
             show_groups(message, university, selected_degree, user_data)
         else:
             bot.send_message(message.chat.id, "Invalid degree. Please select again.")
-            show_degrees(message, university, user_data)
+            show_degrees(message, university, user_data, page)
     else:
         show_universities(message)
 
-def show_groups(message, university, degree, user_data):
-    back_btn = telebot.types.KeyboardButton(text="Back ⬅️")
-    markup = telebot.types.ReplyKeyboardMarkup(one_time_keyboard=True, row_width=2, resize_keyboard=True)
-    groups = list(schedules[university]["degrees"][degree]["groups"].keys())
-    buttons = [telebot.types.KeyboardButton(group) for group in groups]
-    markup.add(*buttons)
-    markup.add(back_btn)
+def show_groups(message, university, degree, user_data, page=0):
+    bot.send_message(message.chat.id, "Select your group:", reply_markup=navigation.keyboard((university, degree), page))
+    expect_reply(message, handle_group_selection, user_data, page)
 
-    bot.send_message(message.chat.id, "Select your group:", reply_markup=markup)
-    bot.register_next_step_handler(message, handle_group_selection, user_data)
-
-def handle_group_selection(message, user_data):
+@conversation_step
+def handle_group_selection(message, user_data, page=0):
     selected_group = message.text
     university = user_data["university"]
     degree = user_data["degree"]
     if selected_group != "Back ⬅️":
-        if selected_group in schedules[university]["degrees"][degree]["groups"]:
+        next_page = navigation.turn_page(selected_group, page)
+        if next_page is not None:
+            show_groups(message, university, degree, user_data, next_page)
+        elif navigation.has_option((university, degree), selected_group):
             user_data["group"] = selected_group
             bot.send_message(message.chat.id, f"You selected {selected_group}. Registration complete!")
             save_user_info(
@@ -437,7 +503,7 @@ def handle_group_selection(message, user_data):
             bot.send_message(message.chat.id, f"Now, use /schedule to view your group's schedule or type / to see available options.", reply_markup=telebot.types.ReplyKeyboardRemove())
         else:
             bot.send_message(message.chat.id, "Invalid group. Please select again.")
-            show_groups(message, university, degree, user_data)
+            show_groups(message, university, degree, user_data, page)
     else:
         show_degrees(message, university, user_data)
 
@@ -445,120 +511,138 @@ def handle_group_selection(message, user_data):
 def get_weekly_schedule(message):
     user_id = str(message.chat.id)
     
-    if user_id not in users_data:
+    user_info = repository.users.get(user_id)
+    if user_info is None:
         bot.send_message(message.chat.id, "You are not registered yet. Use /start to register.", reply_markup=telebot.types.ReplyKeyboardRemove())
         return
-    
-    user_info = users_data[user_id]
+
     university = user_info['university']
     degree = user_info['degree']
     group = user_info['group']
-    
-    weekly_schedule = {}
-    for day in ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']:
-        day_schedule = schedules.get(university, {}).get("degrees", {}).get(degree, {}).get("groups", {}).get(group, {}).get(day, {})
-        weekly_schedule[day] = day_schedule
-
-    image_data = generate_weekly_schedule_image(weekly_schedule, university, degree, group)
-    bot.send_photo(message.chat.id, image_data)
-
-def generate_weekly_schedule_image(weekly_schedule, university, degree, group):
-    cell_width = 250
-    cell_height = 120
-    header_height = 100
-    num_days = 6
-    num_slots = 7
-
-    image_width = (num_days + 1) * cell_width
-    image_height = (num_slots + 1) * cell_height + header_height
-    
-    img = Image.new('RGB', (image_width, image_height), color=(255, 255, 255))
-    draw = ImageDraw.Draw(img)
-    base_dir = os.path.dirname(__file__)  # Gets the directory of the current script
-    font_path = os.path.join(base_dir, "fonts", "RobotoSlab-Regular.ttf")
-    
-    font = ImageFont.truetype(font_path, 22)
-    header_font = ImageFont.truetype(font_path, 36)
-
-    # Draw header
-    header_text = f"University: {university} | Degree: {degree} | Group: {group}"
-    header_text_bbox = draw.textbbox((0, 0), header_text, font=header_font)
-    header_text_width = header_text_bbox[2] - header_text_bbox[0]
-    draw.text(
-        ((image_width - header_text_width) / 2, 20),
-        header_text, font=header_font, fill=(0, 0, 0)
-    )
-    
-    # Draw table
-    table_top = header_height
-    for i in range(num_days + 2):
-        for j in range(num_slots + 1):
-            top_left = (i * cell_width, table_top + j * cell_height)
-            bottom_right = ((i + 1) * cell_width, table_top + (j + 1) * cell_height)
-            draw.rectangle([top_left, bottom_right], outline=(0, 0, 0), width=2)
-
-    # Fill in days
-    days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
-    for i, day in enumerate(days):
-        draw_centered_text(draw, day, ((i + 1) * cell_width, table_top, (i + 2) * cell_width, table_top + cell_height), font)
-
-    # Fill in time slots
-    time_slots = ['9:00-10:20', '10:30-11:50', '12:00-13:20', '14:20-15:40', '15:50-17:10', '17:20-18:40', '18:50-20:10']
-    for j, time_slot in enumerate(time_slots):
-        draw_centered_text(draw, time_slot, (0, table_top + (j + 1) * cell_height, cell_width, table_top + (j + 2) * cell_height), font)
-        
-        for i, day in enumerate(days):
-            lessons = weekly_schedule.get(day, {}).get(time_slot, [])
-            if lessons:
-                lesson_text = lessons[0]
-                cell_rect = ((i + 1) * cell_width, table_top + (j + 1) * cell_height, (i + 2) * cell_width, table_top + (j + 2) * cell_height)
-                draw_wrapped_text(draw, lesson_text, cell_rect, font)
-
-    img_byte_array = io.BytesIO()
-    img.save(img_byte_array, format='PNG')
-    img_byte_array.seek(0)
-    
-    return img_byte_array
-
-def draw_centered_text(draw, text, rect, font, fill=(0, 0, 0)):
-    x1, y1, x2, y2 = rect
-    bbox = draw.textbbox((0, 0), text, font=font)
-    text_width = bbox[2] - bbox[0]
-    text_height = bbox[3] - bbox[1]
-    x = (x2 - x1 - text_width) / 2 + x1
-    y = (y2 - y1 - text_height) / 2 + y1
-    draw.text((x, y), text, font=font, fill=fill)
-
-def draw_wrapped_text(draw, text, rect, font, fill=(0, 0, 0), line_spacing=20):
-    x1, y1, x2, y2 = rect
-    max_width = x2 - x1
-    line_height = font.getbbox('A')[1] + line_spacing  # Add line spacing to line height
-    lines = []
-    
-    for line in text.split('\n'):
-        words = line.split()
-        current_line = words[0] if len(words) != 0 else ""
-        for word in words[1:]:
-            bbox = draw.textbbox((0, 0), current_line + ' ' + word, font=font)
-            if bbox[2] - bbox[0] <= max_width:
-                current_line += ' ' + word
-            else:
-                lines.append(current_line)
-                current_line = word
-        lines.append(current_line)
 
-    total_height = line_height * len(lines)
-    max_lines = (y2 - y1) // line_height  # Number of lines that can fit in the cell
-    if total_height > (y2 - y1):
-        lines = lines[:max_lines]  # Limit the lines to fit in the cell
+    weekly_schedule = build_weekly_schedule(university, degree, group)
+    key = weekly_images.key(university, degree, group, weekly_schedule)
 
-    y = y1 + (y2 - y1 - line_height * len(lines)) / 2
+    file_id = weekly_images.get_file_id(key)
+    if file_id:
+        try:
+            bot.send_photo(message.chat.id, file_id)
+            return
+        except telebot.apihelper.ApiTelegramException as e:
+            print(f"Cached weekly image {key} could not be resent, uploading again: {e}")
+            weekly_images.forget_file_id(key)
 
-    for line in lines:
-        bbox = draw.textbbox((0, 0), line, font=font)
-        w = bbox[2] - bbox[0]
-        x = x1 + (max_width - w) / 2  # Center the text horizontally
-        draw.text((x, y), line, font=font, fill=fill)
-        y += line_height  # Move down for the next line
+    try:
+        image_data = weekly_images.get_or_render(key, lambda: render_service.render(weekly_schedule, university, degree, group, timeout=5))
+    except RenderQueueFull:
+        bot.send_message(message.chat.id, "Too many timetables are being prepared right now. Please try /weekly again in a minute.")
+        return
+    sent_message = bot.send_photo(message.chat.id, image_data)
+    weekly_images.set_file_id(key, sent_message.photo[-1].file_id)
+
+@bot.message_handler(commands=['prewarm'])
+def prewarm_weekly_images(message):
+    if message.from_user.id not in ADMINS:
+        return
+    bot.send_message(message.chat.id, "Rendering weekly timetables for all groups...")
+    jobs = []
+    cached = 0
+    for university, degree, group in repository.schedules.group_keys():
+        weekly_schedule = build_weekly_schedule(university, degree, group)
+        key = weekly_images.key(university, degree, group, weekly_schedule)
+        if weekly_images.get_png(key) is not None:
+            cached += 1
+            continue
+        jobs.append((key, render_service.submit(weekly_schedule, university, degree, group)))
+    for key, job in jobs:
+        weekly_images.put_png(key, job.result())
+    render_stats = render_service.stats()
+    bot.send_message(message.chat.id, f"Weekly timetables ready: {len(jobs)} rendered, {cached} already cached.\nAverage render time: {render_stats['avg_render_time'] * 1000:.0f} ms on {render_stats['workers']} workers.")
+
+@bot.message_handler(commands=['broadcast'])
+def request_broadcast_audience(message):
+    if message.from_user.id not in ADMINS:
+        return
+    bot.send_message(message.chat.id, "Who should receive the broadcast? Reply 'all' or 'University|Degree|Group' (degree and group are optional).")
+    expect_reply(message, handle_broadcast_audience)
+
+@conversation_step
+def handle_broadcast_audience(message):
+    audience = parse_audience(message.text or "")
+    recipients = pruner.active(subscribers.audience(**audience))
+    if not recipients:
+        bot.send_message(message.chat.id, f"No users found for {describe_audience(audience)}.")
+        return
+    bot.send_message(message.chat.id, f"{len(recipients)} users in {describe_audience(audience)}. Send the message text, or a photo, document or animation with a caption.")
+    expect_reply(message, handle_broadcast_content, audience, recipients)
+
+@conversation_step
+def handle_broadcast_content(message, audience, recipients):
+    # Media sent to the bot already has a file_id, so nothing is uploaded again.
+    if message.content_type == 'photo':
+        text, media, media_type = message.caption or "", message.photo[-1].file_id, 'photo'
+    elif message.content_type in ['document', 'animation']:
+        text, media, media_type = message.caption or "", getattr(message, message.content_type).file_id, message.content_type
+    elif message.content_type == 'text':
+        text, media, media_type = message.text, None, None
+    else:
+        bot.send_message(message.chat.id, "Only text, photos, documents and animations can be broadcast.")
+        return
+    bot.send_message(message.chat.id, f"Reply 'send' to send it to {len(recipients)} users, anything else cancels.")
+    expect_reply(message, handle_broadcast_confirmation, audience, recipients, text, media, media_type)
+
+@conversation_step
+def handle_broadcast_confirmation(message, audience, recipients, text, media, media_type):
+    if (message.text or "").lower() != 'send':
+        bot.send_message(message.chat.id, "The broadcast was cancelled.")
+        return
+    start_broadcast(message.chat.id, Broadcast.create(recipients, text, media, media_type, audience))
 
-bot.polling()
+@bot.message_handler(commands=['broadcast_resume'])
+def resume_broadcast(message):
+    if message.from_user.id not in ADMINS:
+        return
+    parts = message.text.split()
+    if len(parts) < 2:
+        unfinished = Broadcast.unfinished()
+        bot.send_message(message.chat.id, "Unfinished broadcasts:\n" + "\n".join(unfinished) if unfinished else "There are no unfinished broadcasts.")
+        return
+    try:
+        broadcast = Broadcast.load(parts[1])
+    except (OSError, ValueError) as e:
+        bot.send_message(message.chat.id, f"Could not load broadcast {parts[1]}: {e}")
+        return
+    start_broadcast(message.chat.id, broadcast)
+
+def start_broadcast(chat_id, broadcast):
+    """Run the broadcast in the background, editing one message with its progress."""
+    progress_message = bot.send_message(chat_id, f"Broadcast {broadcast.id}: starting...")
+
+    def report_progress(sent, failed, total):
+        try:
+            bot.edit_message_text(f"Broadcast {broadcast.id}: {sent + failed}/{total} done, {failed} failed.", chat_id, progress_message.message_id)
+        except telebot.apihelper.ApiTelegramException:
+            pass  # the text did not change since the last report
+
+    def run():
+        sent, failed = broadcast.run(dispatcher, progress=report_progress, pruner=pruner)
+        bot.send_message(chat_id, f"Broadcast {broadcast.id} finished: {sent} sent, {len(failed)} failed.")
+
+    threading.Thread(target=run, name=f"broadcast-{broadcast.id}", daemon=True).start()
+
+def build_weekly_schedule(university, degree, group):
+    return repository.schedules.week(university, degree, group, ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday'])
+
+if __name__ == '__main__':
+    if env("RUN_MODE", "polling") == "webhook":
+        run_webhook(
+            bot,
+            host=env("WEBHOOK_HOST", "127.0.0.1"),
+            port=env.int("WEBHOOK_PORT", 8443),
+            path=env("WEBHOOK_PATH", "/webhook"),
+            public_url=env("WEBHOOK_URL", None),
+            secret=env("WEBHOOK_SECRET", None),
+            workers=env.int("WEBHOOK_WORKERS", 16),
+        )
+    else:
+        bot.polling()
@@ -0,0 +1,113 @@
+import hashlib, json, os, threading
+
+MEDIA_FILE_IDS_FILE = 'media_file_ids.json'
+# Media type -> Bot API method that sends it.
+SEND_METHODS = {'photo': 'sendPhoto', 'document': 'sendDocument', 'animation': 'sendAnimation'}
+
+
+def file_digest(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def result_file_id(media_type, result):
+    """Pick the file_id of the sent media out of a Message result."""
+    if media_type == 'photo':
+        return result['photo'][-1]['file_id']
+    # GIFs sent with sendAnimation may come back as a document.
+    media = result.get(media_type) or result.get('document')
+    return media['file_id'] if media else None
+
+
+class MediaCache:
+    """Persistent "type:sha256 of a local file" -> Telegram file_id map."""
+
+    def __init__(self, file_ids_file=MEDIA_FILE_IDS_FILE):
+        self.file_ids_file = file_ids_file
+        self.file_ids = {}
+        if os.path.exists(file_ids_file):
+            with open(file_ids_file, 'r') as f:
+                self.file_ids = json.load(f)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self.file_ids.get(key)
+
+    def set(self, key, file_id):
+        with self._lock:
+            self.file_ids[key] = file_id
+            self._save()
+
+    def forget(self, key):
+        with self._lock:
+            if self.file_ids.pop(key, None):
+                self._save()
+
+    def _save(self):
+        temp_file = f"{self.file_ids_file}.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump(self.file_ids, f)
+        os.replace(temp_file, self.file_ids_file)
+
+
+class MediaSender:
+    """Sends local media through a Dispatcher, uploading each file only once.
+
+    The first recipient gets the upload and every later one the file_id
+    Telegram returned for it. Concurrent sends of the same file wait for that
+    first upload instead of uploading in parallel.
+    """
+
+    def __init__(self, dispatcher, cache):
+        self.dispatcher = dispatcher
+        self.cache = cache
+        self.uploads = 0
+        self._digests = {}
+        self._upload_locks = {}
+        self._lock = threading.Lock()
+
+    def _key(self, media_type, path):
+        with self._lock:
+            digest = self._digests.get(path)
+        if digest is None:
+            digest = file_digest(path)
+            with self._lock:
+                self._digests[path] = digest
+        return f"{media_type}:{digest}"
+
+    def send(self, chat_id, media_type, media, caption="", parse_mode="Markdown"):
+        """Send `media` (a local path or a file_id) with `caption` to `chat_id`."""
+        method = SEND_METHODS[media_type]
+        payload = {'chat_id': chat_id, 'caption': caption}
+        if parse_mode:
+            payload['parse_mode'] = parse_mode
+        if not os.path.exists(media):
+            return self.dispatcher.call(method, chat_id, {**payload, media_type: media})
+
+        key = self._key(media_type, media)
+        file_id = self.cache.get(key)
+        if file_id:
+            result = self.dispatcher.call(method, chat_id, {**payload, media_type: file_id})
+            if result.ok or result.status_code != 400 or 'file' not in (result.description or '').lower():
+                return result
+            # Telegram no longer knows the file_id, upload the file again.
+            self.cache.forget(key)
+
+        with self._lock:
+            upload_lock = self._upload_locks.setdefault(key, threading.Lock())
+        with upload_lock:
+            file_id = self.cache.get(key)
+            if file_id:
+                return self.dispatcher.call(method, chat_id, {**payload, media_type: file_id})
+            with open(media, 'rb') as file:
+                result = self.dispatcher.call(method, chat_id, payload, files={media_type: file})
+            if result.ok:
+                with self._lock:
+                    self.uploads += 1
+                file_id = result_file_id(media_type, result.result or {})
+                if file_id:
+                    self.cache.set(key, file_id)
+            return result
@@ -0,0 +1,98 @@
+import json, os, time
+from collections import deque
+from datetime import datetime, timedelta
+
+STATE_FORMAT = '%Y-%m-%dT%H:%M'
+
+
+class MinuteScheduler:
+    """Calls `callback(minute)` once for every wall-clock minute, catching up on missed ones."""
+
+    def __init__(self, callback, state_file, max_catchup_minutes=60, history_size=1440):
+        self.callback = callback
+        self.state_file = state_file
+        self.max_catchup = timedelta(minutes=max_catchup_minutes)
+        self.last_minute = self._load_state()
+        self.lags = deque(maxlen=history_size)
+        self.buckets_processed = 0
+        self.buckets_late = 0
+        self.buckets_skipped = 0
+        self.max_lag = 0.0
+
+    def _load_state(self):
+        if not os.path.exists(self.state_file):
+            return None
+        try:
+            with open(self.state_file, 'r') as f:
+                return datetime.strptime(json.load(f)['last_minute'], STATE_FORMAT)
+        except (ValueError, KeyError, json.JSONDecodeError) as e:
+            print(f"Ignoring unreadable scheduler state {self.state_file}: {e}")
+            return None
+
+    def _save_state(self):
+        temp_file = f"{self.state_file}.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump({'last_minute': self.last_minute.strftime(STATE_FORMAT)}, f)
+        os.replace(temp_file, self.state_file)
+
+    def pending_minutes(self, now):
+        current = now.replace(second=0, microsecond=0)
+        if self.last_minute is None:
+            return [current]
+        if self.last_minute >= current:
+            return []
+
+        first = self.last_minute + timedelta(minutes=1)
+        if current - first > self.max_catchup:
+            skipped_until = current - self.max_catchup
+            skipped = int((skipped_until - first).total_seconds() // 60)
+            print(f"Scheduler is {skipped} minutes past the catch-up window, skipping {first:%H:%M}-{skipped_until - timedelta(minutes=1):%H:%M}.")
+            self.buckets_skipped += skipped
+            first = skipped_until
+
+        minutes = []
+        while first <= current:
+            minutes.append(first)
+            first += timedelta(minutes=1)
+        return minutes
+
+    def run_pending(self):
+        for minute in self.pending_minutes(datetime.now()):
+            try:
+                self.callback(minute)
+            except Exception as e:
+                print(f"An error occurred while processing minute {minute:%H:%M}: {e}")
+
+            lag = max(0.0, time.time() - minute.timestamp())
+            self.lags.append((minute.strftime('%H:%M'), lag))
+            self.buckets_processed += 1
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= 60:
+                self.buckets_late += 1
+                print(f"Bucket {minute:%H:%M} delivered {lag:.1f}s behind schedule.")
+
+            self.last_minute = minute
+            self._save_state()
+
+    def stats(self):
+        recent = [lag for _, lag in self.lags]
+        return {
+            'buckets_processed': self.buckets_processed,
+            'buckets_late': self.buckets_late,
+            'buckets_skipped': self.buckets_skipped,
+            'last_lag': recent[-1] if recent else 0.0,
+            'avg_lag': sum(recent) / len(recent) if recent else 0.0,
+            'max_lag': self.max_lag,
+        }
+
+    def sleep_until_next_minute(self):
+        now = time.time()
+        time.sleep(60 - now % 60)
+
+    def run_forever(self, after_pass=None):
+        """Run the pending minutes every minute, calling `after_pass(stats())` after each pass."""
+        while True:
+            self.run_pending()
+            if after_pass:
+                after_pass(self.stats())
+            self.sleep_until_next_minute()
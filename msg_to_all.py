@@ -1,56 +1,65 @@
-import requests, os, json
+import argparse
 from environs import Env
+from storage import open_store
+from repository import DataRepository
+from dispatcher import API_URL, Dispatcher
+from broadcast import Broadcast, describe_audience
+from media_cache import SEND_METHODS
+from pruning import SubscriberPruner
+from subscribers import SubscriberIndex
+
 env = Env()
 env.read_env()
 
 BOT_TOKEN = env("BOT_TOKEN")
 
-def load_data(file):
-    with open(file, 'r') as f:
-        return json.load(f)
 
-message = "Hey everyone! Just a quick heads-up that we've made some updates to the timetable, so please take a moment to review your schedules. Thanks!"
+def print_progress(sent, failed, total):
+    print(f"Sent {sent + failed}/{total} ({failed} failed)")
 
-photo_path = None
+def main():
+    parser = argparse.ArgumentParser(description="Send a message or media to the bot's users.")
+    parser.add_argument('message', nargs='?', help="Markdown text, used as the caption when sending media")
+    media = parser.add_mutually_exclusive_group()
+    for media_type in SEND_METHODS:
+        media.add_argument(f'--{media_type}', help=f"path or Telegram file_id of a {media_type} to send, uploaded only once")
+    parser.add_argument('--university')
+    parser.add_argument('--degree')
+    parser.add_argument('--group')
+    parser.add_argument('--resume', metavar='ID', help="continue an interrupted broadcast")
+    parser.add_argument('--list', action='store_true', help="list the broadcasts that did not finish")
+    args = parser.parse_args()
 
-users_id = load_data("users_data.json").keys()
+    if args.list:
+        for broadcast_id in Broadcast.unfinished():
+            print(broadcast_id)
+        return
 
-users_not_using_bot = []
+    repository = DataRepository(open_store(env))
+    pruner = SubscriberPruner(repository)
+    if args.resume:
+        broadcast = Broadcast.load(args.resume)
+        print(f"Resuming broadcast {broadcast.id}: {len(broadcast.pending())} of {len(broadcast.recipients)} users left.")
+    else:
+        media_type = next((media_type for media_type in SEND_METHODS if getattr(args, media_type)), None)
+        if not args.message and not media_type:
+            parser.error("a message or media is required")
+        audience = {key: value for key, value in (('university', args.university), ('degree', args.degree), ('group', args.group)) if value}
+        recipients = pruner.active(SubscriberIndex(repository).audience(**audience))
+        broadcast = Broadcast.create(recipients, args.message or "", media_type and getattr(args, media_type), media_type, audience)
+        print(f"Broadcast {broadcast.id} to {describe_audience(audience)}: {len(broadcast.recipients)} users.")
 
-def send_message(user_id, text):
-    url = f'https://api.telegram.org/bot{BOT_TOKEN}/sendMessage'
-    payload = {
-        'chat_id': user_id,
-        'text': text,
-        'parse_mode': 'Markdown'
-    }
-    return requests.post(url, data=payload)
+    dispatcher = Dispatcher(BOT_TOKEN, api_url=env("TELEGRAM_API_URL", API_URL), workers=env.int("DISPATCH_WORKERS", 16), rate=env.float("DISPATCH_RATE", 30))
+    try:
+        sent, failed = broadcast.run(dispatcher, progress=print_progress, pruner=pruner)
+    except KeyboardInterrupt:
+        print(f"Interrupted, resume with: python msg_to_all.py --resume {broadcast.id}")
+        raise
+    finally:
+        dispatcher.close()
 
-def send_photo(user_id, photo, caption):
-    url = f'https://api.telegram.org/bot{BOT_TOKEN}/sendPhoto'
-    payload = {
-        'chat_id': user_id,
-        'caption': caption,
-        'parse_mode': 'Markdown'
-    }
-    with open(photo, 'rb') as file:
-        files = {'photo': file}
-        return requests.post(url, data=payload, files=files)
+    print(f"Done: {sent} sent, {len(failed)} failed.")
+    print(pruner.report())
 
-for user_id in users_id:
-    try:
-        if photo_path:
-            response = send_photo(user_id, photo_path, message)
-        else:
-            response = send_message(user_id, message)
-        
-        if response.status_code == 200:
-            print(f'Message has been sent to {user_id} successfully!')
-        else:
-            print(f'Error sending message: {response.status_code}, Couldn`t send message to: {user_id}')
-            users_not_using_bot.append(user_id)
-    except Exception as e:
-        print(f'Error sending message: {e}, Couldn`t send message to: {user_id}')
-        users_not_using_bot.append(user_id)
-
-print(users_not_using_bot)
\ No newline at end of file
+if __name__ == '__main__':
+    main()
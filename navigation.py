@@ -0,0 +1,83 @@
+import threading
+from telebot.types import KeyboardButton, ReplyKeyboardMarkup
+
+BACK_BUTTON = "Back ⬅️"
+PREVIOUS_BUTTON = "⬅️ Previous"
+MORE_BUTTON = "More ➡️"
+PAGE_SIZE = 40
+
+
+class NavigationIndex:
+    """University / degree / group selection menus, built once per schedules version.
+
+    Nodes are () for the universities, (university,) for its degrees and
+    (university, degree) for its groups. Every page of every node keeps its
+    keyboard already serialized to JSON. The ScheduleModel itself is the flat
+    (university, degree, group) lookup.
+    """
+
+    def __init__(self, repository, page_size=PAGE_SIZE, row_width=2):
+        self.repository = repository
+        self.page_size = page_size
+        self.row_width = row_width
+        self.version = None
+        self.options = {}
+        self.keyboards = {}
+        self.builds = 0
+        self._lock = threading.Lock()
+
+    def _current(self):
+        version = self.repository.signature('schedules')
+        if version != self.version:
+            with self._lock:
+                if version != self.version:
+                    self._build(self.repository.schedules)
+                    self.version = version
+        return self
+
+    def _build(self, schedules):
+        options = {(): schedules.universities()}
+        for university in schedules.universities():
+            options[(university,)] = schedules.degrees(university)
+            for degree in schedules.degrees(university):
+                options[(university, degree)] = schedules.groups(university, degree)
+        keyboards = {}
+        for node, names in options.items():
+            for page in range(self._page_count(names)):
+                keyboards[(node, page)] = self._keyboard(names, page)
+        # Swap everything in at once so readers never see half a rebuild.
+        self.options, self.keyboards = {node: frozenset(names) for node, names in options.items()}, keyboards
+        self.builds += 1
+
+    def _page_count(self, names):
+        return max(1, -(-len(names) // self.page_size))
+
+    def _keyboard(self, names, page):
+        markup = ReplyKeyboardMarkup(one_time_keyboard=True, row_width=self.row_width, resize_keyboard=True)
+        markup.add(*[KeyboardButton(name) for name in names[page * self.page_size:(page + 1) * self.page_size]])
+        navigation = []
+        if page > 0:
+            navigation.append(KeyboardButton(PREVIOUS_BUTTON))
+        if page + 1 < self._page_count(names):
+            navigation.append(KeyboardButton(MORE_BUTTON))
+        if navigation:
+            markup.row(*navigation)
+        markup.add(KeyboardButton(BACK_BUTTON))
+        return markup.to_json()
+
+    def keyboard(self, node, page=0):
+        """The serialized keyboard of a page of `node`, usable as reply_markup."""
+        keyboards = self._current().keyboards
+        return keyboards.get((tuple(node), page)) or keyboards.get((tuple(node), 0))
+
+    @staticmethod
+    def turn_page(text, page):
+        """The page to show after `text` was chosen on `page`, or None if it was no page button."""
+        if text == MORE_BUTTON:
+            return page + 1
+        if text == PREVIOUS_BUTTON:
+            return max(page - 1, 0)
+        return None
+
+    def has_option(self, node, name):
+        return name in self._current().options.get(tuple(node), ())
@@ -0,0 +1,61 @@
+import json, threading
+from dispatcher import PERMANENT_FAILURES, classify
+from storage import file_lock, is_active, load_data, write_atomic
+
+DELIVERY_STATS_FILE = 'delivery_stats.json'
+OUTCOMES = ('ok', 'blocked', 'chat_not_found', 'rate_limited', 'server_error', 'network_error', 'failed')
+
+
+class SubscriberPruner:
+    """Marks chats that permanently refuse messages inactive and counts delivery outcomes.
+
+    Counters are added to `stats_file`, which the reminder service, broadcasts
+    and the bot share, so /count can report what every sender pruned. The send
+    time saved is estimated as skipped sends times the average time a send to
+    a dead chat took.
+    """
+
+    def __init__(self, repository, stats_file=DELIVERY_STATS_FILE):
+        self.repository = repository
+        self.stats_file = stats_file
+        self._lock = threading.Lock()
+
+    def active(self, user_ids):
+        """Drop the inactive users from `user_ids`, counting them as skipped sends."""
+        users = self.repository.users
+        active = [user_id for user_id in user_ids if is_active(users.get(str(user_id), {}))]
+        if len(active) < len(user_ids):
+            self._add({'skipped': len(user_ids) - len(active)})
+        return active
+
+    def record(self, results):
+        """Count the outcome of each DeliveryResult and deactivate the dead chats, returning how many were pruned."""
+        counts = dict.fromkeys(OUTCOMES, 0)
+        dead, dead_time = [], 0.0
+        for result in results:
+            outcome = classify(result)
+            counts[outcome] += 1
+            if outcome in PERMANENT_FAILURES:
+                dead.append(str(result.chat_id))
+                dead_time += result.elapsed
+        pruned = self.repository.deactivate_users(dead) if dead else 0
+        self._add({**counts, 'pruned': pruned, 'dead_sends': len(dead), 'dead_send_time': dead_time})
+        return pruned
+
+    def _add(self, counters):
+        with self._lock, file_lock(self.stats_file):
+            stats = load_data(self.stats_file)
+            for name, value in counters.items():
+                stats[name] = stats.get(name, 0) + value
+            write_atomic(self.stats_file, json.dumps(stats).encode())
+
+    def report(self):
+        stats = dict.fromkeys(OUTCOMES + ('pruned', 'skipped', 'dead_sends', 'dead_send_time'), 0)
+        stats.update(load_data(self.stats_file))
+        average = stats['dead_send_time'] / stats['dead_sends'] if stats['dead_sends'] else 0.0
+        return (
+            f"Deliveries: {stats['ok']} ok, {stats['blocked']} blocked, {stats['chat_not_found']} chat not found, "
+            f"{stats['rate_limited']} rate limited, {stats['server_error']} server errors, {stats['network_error']} network errors, {stats['failed']} other failures\n"
+            f"Pruned {stats['pruned']} dead chats; {stats['skipped']} sends skipped since, saving about {stats['skipped'] * average:.0f}s "
+            f"({average * 1000:.0f} ms per dead send)"
+        )
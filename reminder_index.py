@@ -0,0 +1,72 @@
+import threading
+
+
+class ReminderIndex:
+    """In-memory "HH:MM" -> set of user ids index over the stored reminder times."""
+
+    def __init__(self, store):
+        self.store = store
+        self.times = {}
+        self.buckets = {}
+        self._signature = None
+        self._loads = None
+        self._lock = threading.Lock()
+
+    def rebuild(self, times):
+        buckets = {}
+        for user_id, notify_time in times.items():
+            buckets.setdefault(notify_time, set()).add(str(user_id))
+        with self._lock:
+            self.times = {str(user_id): notify_time for user_id, notify_time in times.items()}
+            self.buckets = buckets
+
+    def refresh(self):
+        """Reload the reminders only if the store reports they changed since the last load."""
+        signature = self.store.signature('reminders')
+        if signature == self._signature:
+            return False
+        self.rebuild(self.store.load_reminders())
+        self._signature = signature
+        self._loads = self.store.loads['reminders']
+        return True
+
+    def mark_saved(self):
+        """Record the current store state after this process wrote it itself, unless it had to reload."""
+        signature = self.store.signature('reminders')
+        if self.store.loads['reminders'] == self._loads:
+            self._signature = signature
+
+    def set(self, user_id, notify_time):
+        user_id = str(user_id)
+        with self._lock:
+            old_time = self.times.get(user_id)
+            if old_time is not None:
+                self._discard(old_time, user_id)
+            self.times[user_id] = notify_time
+            self.buckets.setdefault(notify_time, set()).add(user_id)
+
+    def remove(self, user_id):
+        user_id = str(user_id)
+        with self._lock:
+            old_time = self.times.pop(user_id, None)
+            if old_time is None:
+                return False
+            self._discard(old_time, user_id)
+            return True
+
+    def _discard(self, notify_time, user_id):
+        bucket = self.buckets.get(notify_time)
+        if bucket is not None:
+            bucket.discard(user_id)
+            if not bucket:
+                del self.buckets[notify_time]
+
+    def get(self, user_id):
+        return self.times.get(str(user_id))
+
+    def users_at(self, minute):
+        with self._lock:
+            return set(self.buckets.get(minute, ()))
+
+    def __len__(self):
+        return len(self.times)
@@ -0,0 +1,74 @@
+import threading
+
+
+def render_day_schedule(university, degree, group, day, lessons):
+    """Build the Markdown message for one group's (time slot, lesson info) pairs on `day`."""
+    if not lessons:
+        return f"📅 Schedule for *{day}*:\n\n🏫 University: *{university}*\n🎓 Degree: *{degree}*\n👥 Group: *{group}*\n\nNo lessons scheduled for today."
+
+    parts = [
+        f"📅 Schedule for *{day}*:\n\n",
+        f"🏫 University: *{university}*\n",
+        f"🎓 Degree: *{degree}*\n",
+        f"👥 Group: *{group}*\n\n",
+        "*Lessons:*\n",
+    ]
+    for time_slot, lesson_info in lessons:
+        parts.append(f"🕒 *{time_slot}*\n")
+        parts.append(f"📘 Subject: {lesson_info[0]}\n")
+        if len(lesson_info) > 1:
+            teacher_name = lesson_info[1].strip()
+            teacher_info = lesson_info[2].strip()
+            if teacher_info.lower() != "none":
+                parts.append(f"👤 Teacher: {teacher_name} ({teacher_info})\n")
+            else:
+                parts.append(f"👤 Teacher: {teacher_name}\n")
+        parts.append("\n")
+    return ''.join(parts)
+
+# What a user's reminder says on a day without lessons, kept as 'empty_days' in their user info.
+EMPTY_DAY_MODES = ('full', 'short', 'skip')
+
+
+def render_empty_day_short(group, day):
+    return f"📅 No lessons for *{group}* on {day}."
+
+
+class ScheduleRenderer:
+    """Memoizes rendered day schedules per (university, degree, group, day).
+
+    `get_lessons(university, degree, group, day)` returns the lesson pairs to render.
+    """
+
+    def __init__(self, get_lessons):
+        self.get_lessons = get_lessons
+        self.cache = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def render(self, university, degree, group, day):
+        key = (university, degree, group, day)
+        with self._lock:
+            message = self.cache.get(key)
+            if message is not None:
+                self.hits += 1
+                return message
+            self.misses += 1
+
+        message = render_day_schedule(university, degree, group, day, self.get_lessons(university, degree, group, day))
+        with self._lock:
+            self.cache[key] = message
+        return message
+
+    def invalidate_group(self, university, degree, group):
+        with self._lock:
+            for key in [key for key in self.cache if key[:3] == (university, degree, group)]:
+                del self.cache[key]
+
+    def invalidate(self):
+        with self._lock:
+            self.cache.clear()
+
+    def stats(self):
+        return {'entries': len(self.cache), 'hits': self.hits, 'misses': self.misses}
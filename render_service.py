@@ -0,0 +1,117 @@
+import multiprocessing, os, threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import weekly_image
+
+
+class RenderQueueFull(Exception):
+    pass
+
+
+class RenderService:
+    """Renders weekly timetable images in a process pool, off the bot's handler threads.
+
+    At most `max_pending` jobs are queued or running at once; `submit` waits up
+    to `timeout` seconds for a free slot and raises RenderQueueFull otherwise.
+    If a worker process dies the pool is replaced and the job retried once.
+    """
+
+    def __init__(self, workers=None, max_pending=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 4
+        self.render_times = deque(maxlen=500)
+        self.rejected = 0
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # The bot is multithreaded by the time the pool starts, and forking it could
+                # copy a lock another thread holds; workers load their fonts themselves.
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('forkserver'),
+                    initializer=weekly_image.load_fonts,
+                )
+            return self._executor
+
+    def _reset_executor(self, broken):
+        with self._lock:
+            if self._executor is broken:
+                self._executor = None
+        broken.shutdown(wait=False)
+
+    def submit(self, weekly_schedule, university, degree, group, timeout=None):
+        """Queue a render job and return a Future resolving to the PNG bytes."""
+        if not self._slots.acquire(timeout=timeout):
+            self.rejected += 1
+            raise RenderQueueFull(f"{self.max_pending} render jobs are already pending")
+
+        result = Future()
+        try:
+            self._start(result, (weekly_schedule, university, degree, group), retry=True)
+        except Exception:
+            self._slots.release()
+            raise
+        return result
+
+    def _start(self, result, job_args, retry):
+        executor = self._get_executor()
+        try:
+            job = executor.submit(weekly_image.render_weekly_png, *job_args)
+        except BrokenProcessPool:
+            self._reset_executor(executor)
+            if not retry:
+                raise
+            return self._start(result, job_args, retry=False)
+        label = " / ".join(map(str, job_args[1:]))
+
+        def on_done(job):
+            try:
+                image_data, seconds = job.result()
+            except BrokenProcessPool as e:
+                self._reset_executor(executor)
+                error = e
+                if retry:
+                    print(f"Render worker died, retrying {label} in a new pool.")
+                    try:
+                        self._start(result, job_args, retry=False)
+                        return
+                    except Exception as retry_error:
+                        error = retry_error
+                self._slots.release()
+                result.set_exception(error)
+                return
+            except Exception as e:
+                self._slots.release()
+                result.set_exception(e)
+                return
+            self._slots.release()
+            self.render_times.append(seconds)
+            print(f"Rendered weekly timetable for {label} in {seconds * 1000:.0f} ms.")
+            result.set_result(image_data)
+
+        job.add_done_callback(on_done)
+
+    def render(self, weekly_schedule, university, degree, group, timeout=None):
+        return self.submit(weekly_schedule, university, degree, group, timeout).result()
+
+    def stats(self):
+        times = list(self.render_times)
+        return {
+            'workers': self.workers,
+            'jobs': len(times),
+            'rejected': self.rejected,
+            'avg_render_time': sum(times) / len(times) if times else 0.0,
+            'max_render_time': max(times) if times else 0.0,
+        }
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
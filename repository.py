@@ -0,0 +1,111 @@
+import threading, time
+from schedule_model import ScheduleModel
+
+DATASETS = ('users', 'reminders', 'schedules')
+
+
+class DataRepository:
+    """Serves users, reminder times and schedules from memory.
+
+    A dataset is reloaded from the store only when the store's signature for it
+    changes (file mtime/size for JSON, the version counter for SQLite), checked
+    at most every `check_interval` seconds. Writes go through to the store and
+    update the in-memory copy directly. Schedules are held as a ScheduleModel.
+    """
+
+    def __init__(self, store, check_interval=1.0):
+        self.store = store
+        self.check_interval = check_interval
+        self.data = {}
+        self.versions = dict.fromkeys(DATASETS, 0)
+        self.loads = dict.fromkeys(DATASETS, 0)
+        self.listeners = []
+        self._signatures = {}
+        self._checked = {}
+        self._lock = threading.RLock()
+        for name in DATASETS:
+            self.refresh(name, force=True)
+
+    def refresh(self, name, force=False):
+        """Reload `name` if the store changed it, returning True when it was reloaded."""
+        now = time.monotonic()
+        if not force and now - self._checked.get(name, 0) < self.check_interval:
+            return False
+        with self._lock:
+            self._checked[name] = now
+            signature = self.store.signature(name)
+            if not force and signature == self._signatures.get(name):
+                return False
+            data = getattr(self.store, f"load_{name}")()
+            self.data[name] = ScheduleModel.from_schedules(data) if name == 'schedules' else data
+            self._signatures[name] = signature
+            self.versions[name] += 1
+            self.loads[name] += 1
+        for listener in self.listeners:
+            listener(name)
+        return True
+
+    def on_reload(self, listener):
+        """Call `listener(name)` whenever a dataset is reloaded from the store."""
+        self.listeners.append(listener)
+
+    def get(self, name):
+        self.refresh(name)
+        return self.data[name]
+
+    @property
+    def users(self):
+        return self.get('users')
+
+    @property
+    def reminders(self):
+        return self.get('reminders')
+
+    @property
+    def schedules(self):
+        return self.get('schedules')
+
+    def signature(self, name):
+        self.refresh(name)
+        return self.versions[name]
+
+    def load_reminders(self):
+        return self.reminders
+
+    def _write(self, name, write, update):
+        """Run the store `write`, then bring the in-memory copy up to date.
+
+        If another process changed the dataset since it was loaded, `update`
+        would patch stale data and hide that change, so the dataset is
+        reloaded from the store instead.
+        """
+        with self._lock:
+            current = self.store.signature(name) == self._signatures.get(name)
+            result = write()
+            if current:
+                update(self.data[name])
+                self._signatures[name] = self.store.signature(name)
+                self.versions[name] += 1
+        if not current:
+            self.refresh(name, force=True)
+        return result
+
+    def save_user(self, user_id, info):
+        self._write('users', lambda: self.store.save_user(user_id, info), lambda users: users.update({str(user_id): info}))
+
+    def deactivate_users(self, user_ids):
+        """Mark the users inactive, returning how many were active before."""
+        def update(users):
+            for user_id in user_ids:
+                if str(user_id) in users:
+                    users[str(user_id)]['active'] = False
+        return self._write('users', lambda: self.store.deactivate_users(user_ids), update)
+
+    def set_reminder(self, user_id, notify_time):
+        self._write('reminders', lambda: self.store.set_reminder(user_id, notify_time), lambda reminders: reminders.update({str(user_id): notify_time}))
+
+    def remove_reminder(self, user_id):
+        return self._write('reminders', lambda: self.store.remove_reminder(user_id), lambda reminders: reminders.pop(str(user_id), None))
+
+    def replace_groups(self, university, degree, groups):
+        self._write('schedules', lambda: self.store.replace_groups(university, degree, groups), lambda schedules: schedules.replace_groups(university, degree, groups))
@@ -1,107 +1,327 @@
-import time, os, requests
+import time, os, io, json, heapq, hashlib, argparse, requests
 import pandas as pd
-from requests.exceptions import RequestException
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from environs import Env
+from dispatcher import API_URL, Dispatcher
+from excel_import import parse_sheet
+from schedule_diff import affected_groups, apply_changes, diff_schedules, summarize_changes
+from storage import open_store
+from repository import DataRepository
+from subscribers import SubscriberIndex
 
 env = Env()
 env.read_env()
 
-url = f'https://api.telegram.org/bot{env("BOT_TOKEN")}/sendMessage'
-
-# Constants for Google Sheets documents and file paths
-COURSE_TIMETABLES = {
-    '1-course': {
-        'list1': (env("COURSE_1"), '0'),
-        'list2': (env("COURSE_1"), '1187396123')
-    },
-    '2-course': {
-        'list1': (env("COURSE_2"), '0'),
-        'list2': (env("COURSE_2"), '1187396123'),
-        'list3': (env("COURSE_2"), '554105149'),
-        'list4': (env("COURSE_2"), '514459562')
-    },
-    '3-course': {
-        'list1': (env("COURSE_3"), '0')
+SHEETS_BASE_URL = env("SHEETS_BASE_URL", "https://docs.google.com")
+SHEETS_FILE = env("SCANNER_SHEETS_FILE", "sheets.json")
+STATE_FILE = 'scanner_state.json'
+SNAPSHOT_DIR = 'scanner_snapshots'
+APPLY_CHANGES = env.bool("SCANNER_APPLY", False)
+FETCH_WORKERS = env.int("SCANNER_WORKERS", 4)
+
+# Polling intervals in seconds
+FAST_INTERVAL = env.int("SCANNER_FAST_INTERVAL", 300)  # while a sheet is being edited
+WORKING_INTERVAL = env.int("SCANNER_WORKING_INTERVAL", 900)  # during working hours
+QUIET_INTERVAL = env.int("SCANNER_QUIET_INTERVAL", 3600)  # outside working hours
+MAX_INTERVAL = env.int("SCANNER_MAX_INTERVAL", 18000)
+RECENT_CHANGE_WINDOW = env.int("SCANNER_RECENT_CHANGE_WINDOW", 7200)
+WORKING_HOURS = (env.int("SCANNER_WORKDAY_START", 8), env.int("SCANNER_WORKDAY_END", 20))
+
+def default_course_timetables():
+    """The sheets polled when there is no sheets file: COURSE_<n> spreadsheets and their tabs."""
+    return {
+        '1-course': {
+            'target': env("COURSE_1_TARGET", None),
+            'sheets': {
+                'list1': (env("COURSE_1"), '0'),
+                'list2': (env("COURSE_1"), '1187396123')
+            }
+        },
+        '2-course': {
+            'target': env("COURSE_2_TARGET", None),
+            'sheets': {
+                'list1': (env("COURSE_2"), '0'),
+                'list2': (env("COURSE_2"), '1187396123'),
+                'list3': (env("COURSE_2"), '554105149'),
+                'list4': (env("COURSE_2"), '514459562')
+            }
+        },
+        '3-course': {
+            'target': env("COURSE_3_TARGET", None),
+            'sheets': {
+                'list1': (env("COURSE_3"), '0')
+            }
+        }
     }
-}
 
-def send_message(chat_id, text, parse_mode="Markdown", retries=3):
-    payload = {
-        'chat_id': chat_id,
-        'text': text,
-        'parse_mode': parse_mode
+def load_course_timetables(file=SHEETS_FILE):
+    """Load `{course: {"target": "University|Degree" or null, "sheets": {name: [sheet_id, gid]}}}`."""
+    if not os.path.exists(file):
+        return default_course_timetables()
+    with open(file, 'r') as f:
+        return json.load(f)
+
+def list_sheets(course_timetables):
+    """Flatten the courses into `{state name: (course, list name, url, target)}`."""
+    return {
+        f"{course}_{list_name}": (course, list_name, sheet_url(sheet_id, gid), course_data.get('target'))
+        for course, course_data in course_timetables.items()
+        for list_name, (sheet_id, gid) in course_data['sheets'].items()
     }
-    attempt = 0
-    while attempt < retries:
-        try:
-            response = requests.post(url, json=payload, timeout=10)  # Added timeout to avoid hanging
-            if response.status_code == 200:
-                print(f"Message successfully sent to {chat_id}.")
-                return True
-            else:
-                print(f"Failed to send message to {chat_id}. Response: {response.text}")
-        except RequestException as e:
-            print(f"Request error while sending message to {chat_id}: {e}")
-
-        attempt += 1
-        print(f"Retrying ({attempt}/{retries})...")
-        time.sleep(2)  # Wait 2 seconds before retrying
-
-    print(f"Failed to send message to {chat_id} after {retries} attempts.")
-    return False
-
-def download_sheet(sheet_id, gid, list_name):
-    url = f"https://docs.google.com/spreadsheets/d/{sheet_id}/export?format=csv&gid={gid}"
-    response = requests.get(url)
-    if response.status_code == 200:
-        new_file = f"new_{list_name}.csv"
-        with open(new_file, 'wb') as file:
-            file.write(response.content)
-        return new_file
-    else:
-        print(f"Failed to download the sheet for {list_name}.")
+
+_dispatcher = None
+
+def get_dispatcher():
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = Dispatcher(env("BOT_TOKEN"), api_url=env("TELEGRAM_API_URL", API_URL))
+    return _dispatcher
+
+_repository = None
+
+def get_repository():
+    global _repository
+    if _repository is None:
+        _repository = DataRepository(open_store(env))
+    return _repository
+
+_subscribers = None
+
+def get_subscribers():
+    global _subscribers
+    if _subscribers is None:
+        _subscribers = SubscriberIndex(get_repository())
+    return _subscribers
+
+def send_message(chat_id, text, parse_mode="Markdown"):
+    result = get_dispatcher().send_message(chat_id, text, parse_mode)
+    if result.ok:
+        print(f"Message successfully sent to {chat_id}.")
+    return result.ok
+
+session = requests.Session()
+session.mount('https://', HTTPAdapter(pool_maxsize=FETCH_WORKERS))
+session.mount('http://', HTTPAdapter(pool_maxsize=FETCH_WORKERS))
+
+def fetch_sheet(url):
+    """Download `url` over the pooled session and return the raw bytes, or None on failure."""
+    try:
+        response = session.get(url, timeout=30)
+    except requests.RequestException as e:
+        print(f"Request error while downloading {url}: {e}")
+        return None
+    if response.status_code != 200:
+        print(f"Failed to download {url}: {response.status_code}")
+        return None
+    return response.content
+
+def sheet_url(sheet_id, gid):
+    return f"{SHEETS_BASE_URL}/spreadsheets/d/{sheet_id}/export?format=csv&gid={gid}"
+
+def load_state():
+    """Per-sheet hash, change history and poll metrics; older state files held only hashes."""
+    if not os.path.exists(STATE_FILE):
+        return {}
+    with open(STATE_FILE, 'r') as f:
+        state = json.load(f)
+    return {name: {'hash': value} if isinstance(value, str) else value for name, value in state.items()}
+
+def save_state(state):
+    with open(f"{STATE_FILE}.tmp", 'w') as f:
+        json.dump(state, f, indent=4)
+    os.replace(f"{STATE_FILE}.tmp", STATE_FILE)
+
+def timed_fetch(fetch, url):
+    started = time.perf_counter()
+    content = fetch(url)
+    return content, time.perf_counter() - started
+
+def download_sheets(sheets, fetch=fetch_sheet):
+    """Fetch `{name: url}` concurrently and return `{name: (bytes or None, seconds)}`."""
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+        return dict(zip(sheets, executor.map(lambda url: timed_fetch(fetch, url), sheets.values())))
+
+def snapshot_path(name):
+    return os.path.join(SNAPSHOT_DIR, f"{name}.csv")
+
+def load_snapshot(name):
+    if not os.path.exists(snapshot_path(name)):
         return None
+    with open(snapshot_path(name), 'rb') as f:
+        return f.read()
 
+def save_snapshot(name, content):
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    with open(f"{snapshot_path(name)}.tmp", 'wb') as f:
+        f.write(content)
+    os.replace(f"{snapshot_path(name)}.tmp", snapshot_path(name))
 
-def check_for_sheet_changes():
-    changes = ""
-    for course, lists in COURSE_TIMETABLES.items():
-        course_changed = False
-        for list_name, (sheet_id, gid) in lists.items():
-            new_file = download_sheet(sheet_id, gid, f"{course}_{list_name}")
-            if new_file:
-                existing_file = f"{course}_{list_name}.csv"
-                if os.path.exists(existing_file):
-                    try:
-                        # Load both files into DataFrames
-                        existing_df = pd.read_csv(existing_file)
-                        new_df = pd.read_csv(new_file)
-
-                        # Check if DataFrames are equal
-                        if not existing_df.equals(new_df):
-                            # Overwrite the existing file
-                            os.remove(existing_file)
-                            os.rename(new_file, existing_file)
-                            course_changed = True
-                        else:
-                            os.remove(new_file)
-                    except Exception as e:
-                        print(f"Error while comparing files for {course} {list_name}: {e}")
-                        os.remove(new_file)
-                else:
-                    # If no existing file, save the new file as the initial version
-                    os.rename(new_file, existing_file)
-                    course_changed = True
-
-        if course_changed:
-            changes += f"Changes in {course} timetable. "
+def count_cell_changes(old_df, new_df):
+    """Number of differing cells, for sheets that are not laid out as a timetable."""
+    if old_df.shape != new_df.shape or list(old_df.columns) != list(new_df.columns):
+        return max(old_df.size, new_df.size)
+    return int((old_df.fillna('') != new_df.fillna('')).to_numpy().sum())
 
+def diff_sheet(old_content, new_df):
+    """Return (changes, parsed new schedule, changed cell count) between two exports of a sheet."""
+    old_df = pd.read_csv(io.BytesIO(old_content))
+    try:
+        new_schedule = parse_sheet(new_df)
+        changes = diff_schedules(parse_sheet(old_df), new_schedule)
+        return changes, new_schedule, len(changes)
+    except (KeyError, TypeError, AttributeError, ValueError):
+        # Missing timetable columns or cells parse_sheet cannot read
+        return None, None, count_cell_changes(old_df, new_df)
+
+def apply_sheet_changes(target, new_schedule, changes):
+    """Write a sheet's changes into the stored schedules and notify the affected users."""
+    university, degree = target.split('|', 1)
+    repository = get_repository()
+    stored_groups = repository.schedules.degree_groups(university, degree)
+    groups = affected_groups(changes)
+    updated_groups = {group: dict(stored_groups.get(group, {})) for group in groups}
+    apply_changes(updated_groups, new_schedule, changes)
+    repository.replace_groups(university, degree, updated_groups)
+
+    users = get_subscribers().users_in_groups(university, degree, groups)
+    for user_id in users:
+        text = f"📢 The timetable of your group {repository.users[user_id]['group']} has changed. Use /schedule or /weekly to see the update."
+        get_dispatcher().submit('sendMessage', user_id, {'chat_id': user_id, 'text': text})
+    return len(users)
+
+def process_sheet(course, list_name, target, content, sheet_state):
+    """Compare a downloaded sheet with its last version, returning (changed, report)."""
+    name = f"{course}_{list_name}"
+    digest = hashlib.sha256(content).hexdigest()
+    if sheet_state.get('hash') == digest:
+        return False, None
+
+    # Only parse sheets whose bytes changed, to make sure the export is a valid table
+    new_df = pd.read_csv(io.BytesIO(content))
+    old_content = load_snapshot(name)
+    changes, new_schedule, changed_cells = diff_sheet(old_content, new_df) if old_content else (None, None, None)
+
+    report = None
+    if changes:
+        report = f"{course} {list_name}:\n{summarize_changes(changes, limit=10)}"
+        if APPLY_CHANGES and target:
+            notified = apply_sheet_changes(target, new_schedule, changes)
+            report += f"\nApplied to {target}, notified {notified} users."
+    elif changed_cells:
+        report = f"{course} {list_name}: {changed_cells} cells changed."
+
+    # Accept the new version only now, so a failed apply is retried on the next poll
+    sheet_state['hash'] = digest
+    save_snapshot(name, content)
+    if changed_cells == 0:
+        # Only formatting or ordering changed, nothing the bot shows
+        return False, None
+    return True, report
+
+def record_poll(sheet_state, content, seconds, changed, now):
+    metrics = sheet_state.setdefault('metrics', {'polls': 0, 'bytes': 0, 'total_latency': 0.0})
+    metrics['polls'] += 1
+    metrics['bytes'] += len(content or b'')
+    metrics['total_latency'] += seconds
+    metrics['last_latency'] = seconds
+    sheet_state['last_poll'] = now
+    if changed:
+        sheet_state['last_change'] = now
+        sheet_state['quiet_polls'] = 0
+    elif content is not None:
+        sheet_state['quiet_polls'] = sheet_state.get('quiet_polls', 0) + 1
+
+def poll_sheets(names, sheets, state, fetch=fetch_sheet):
+    """Download and compare the given sheets, returning the changed courses and reports."""
+    contents = download_sheets({name: sheets[name][2] for name in names}, fetch)
+    now = time.time()
+    changed_courses = []
+    reports = []
+    for name in names:
+        course, list_name, url, target = sheets[name]
+        content, seconds = contents[name]
+        sheet_state = state.setdefault(name, {})
+        changed = False
+        if content is not None:
+            try:
+                changed, report = process_sheet(course, list_name, target, content, sheet_state)
+            except Exception as e:
+                print(f"Error while parsing {course} {list_name}: {e}")
+                report = None
+            if report:
+                reports.append(report)
+            if changed and course not in changed_courses:
+                changed_courses.append(course)
+        record_poll(sheet_state, content, seconds, changed, now)
+        print(f"Polled {name} in {seconds:.2f}s, {len(content or b'')} bytes{', changed' if changed else ''}.")
+    save_state(state)
+    return changed_courses, reports
+
+def report_changes(changed_courses, reports):
+    changes = "".join(f"Changes in {course} timetable. " for course in changed_courses)
     if changes:
         send_message(env("GROUP_ID"), f"*{changes}*")
-    else:
+        for report in reports:
+            send_message(env("GROUP_ID"), report, parse_mode=None)
+    return bool(changes)
+
+def check_for_sheet_changes(fetch=fetch_sheet):
+    """Poll every configured sheet once and report to the admin group."""
+    sheets = list_sheets(load_course_timetables())
+    if not report_changes(*poll_sheets(list(sheets), sheets, load_state(), fetch)):
         send_message(env("GROUP_ID"), f"No changes found")
 
+def is_working_time(timestamp):
+    local = time.localtime(timestamp)
+    return local.tm_wday < 6 and WORKING_HOURS[0] <= local.tm_hour < WORKING_HOURS[1]
+
+def next_poll_time(sheet_state, now):
+    """Poll fast while a sheet is being edited, and back off the longer it stays quiet."""
+    if now - sheet_state.get('last_change', 0) < RECENT_CHANGE_WINDOW:
+        return now + FAST_INTERVAL
+
+    backoff = 2 ** min(sheet_state.get('quiet_polls', 0), 10)
+    if is_working_time(now):
+        return now + min(WORKING_INTERVAL * backoff, WORKING_INTERVAL * 4)
+
+    due = now + min(QUIET_INTERVAL * backoff, MAX_INTERVAL)
+    # Never sleep through the start of the working day
+    probe = now - now % 3600 + 3600
+    while probe < due:
+        if is_working_time(probe):
+            return probe
+        probe += 3600
+    return due
+
+def run(fetch=fetch_sheet):
+    """Poll each sheet on its own adaptive schedule, forever."""
+    sheets = list_sheets(load_course_timetables())
+    state = load_state()
+    queue = [(0, name) for name in sheets]
+    heapq.heapify(queue)
+    print(f"Polling {len(sheets)} sheets...")
 
-while True:
-    check_for_sheet_changes()
-    time.sleep(18000)
+    while True:
+        now = time.time()
+        due = []
+        while queue and queue[0][0] <= now:
+            due.append(heapq.heappop(queue)[1])
+
+        if due:
+            report_changes(*poll_sheets(due, sheets, state, fetch))
+            now = time.time()
+            for name in due:
+                heapq.heappush(queue, (next_poll_time(state[name], now), name))
+
+        time.sleep(max(1, min(60, queue[0][0] - time.time())))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Watch the timetable sheets for changes.")
+    parser.add_argument('--once', action='store_true', help="Poll every sheet once and exit.")
+    args = parser.parse_args()
+    if args.once:
+        check_for_sheet_changes()
+    else:
+        run()
@@ -0,0 +1,85 @@
+import json, time
+from collections import namedtuple
+
+# `old` is None for an added lesson and `new` is None for a removed one.
+Change = namedtuple('Change', 'group day slot old new')
+
+
+def _ordered_union(first, second):
+    return list(first) + [key for key in second if key not in first]
+
+def diff_groups(stored_groups, parsed_groups):
+    """Return the (group, day, slot) changes that importing `parsed_groups` makes.
+
+    Like the import itself, groups missing from `parsed_groups` are left alone,
+    while every parsed group replaces the stored one completely.
+    """
+    changes = []
+    for group, days in parsed_groups.items():
+        old_days = stored_groups.get(group, {})
+        for day in _ordered_union(old_days, days):
+            old_slots = old_days.get(day, {})
+            new_slots = days.get(day, {})
+            for slot in _ordered_union(old_slots, new_slots):
+                old, new = old_slots.get(slot), new_slots.get(slot)
+                if old != new:
+                    changes.append(Change(group, day, slot, old, new))
+    return changes
+
+def diff_schedules(old_groups, current_groups):
+    """Like diff_groups, but groups that disappeared from `current_groups` count as removed."""
+    changes = diff_groups(old_groups, current_groups)
+    for group, days in old_groups.items():
+        if group not in current_groups:
+            changes.extend(Change(group, day, slot, lesson, None) for day, slots in days.items() for slot, lesson in slots.items())
+    return changes
+
+def new_groups(stored_groups, parsed_groups):
+    return [group for group in parsed_groups if group not in stored_groups]
+
+def affected_groups(changes):
+    return list(dict.fromkeys(change.group for change in changes))
+
+def apply_changes(stored_groups, parsed_groups, changes):
+    """Update only the days touched by `changes` in place."""
+    for group, day in dict.fromkeys((change.group, change.day) for change in changes):
+        days = stored_groups.setdefault(group, {})
+        parsed_day = parsed_groups.get(group, {}).get(day)
+        if parsed_day:
+            days[day] = dict(parsed_day)
+        else:
+            days.pop(day, None)
+    return stored_groups
+
+def _lesson_name(lesson):
+    return ", ".join(map(str, lesson)) if lesson else "-"
+
+def summarize_changes(changes, added_groups=(), limit=20):
+    """Describe the changes as a short plain-text summary for the admin."""
+    if not changes and not added_groups:
+        return "No changes compared to the stored schedule."
+
+    added = sum(change.old is None for change in changes)
+    removed = sum(change.new is None for change in changes)
+    changed = len(changes) - added - removed
+    lines = [f"{len(changes)} lesson changes in {len(affected_groups(changes))} groups: {added} added, {changed} changed, {removed} removed."]
+    if added_groups:
+        lines.append(f"New groups: {', '.join(map(str, added_groups))}")
+    for change in changes[:limit]:
+        if change.old is None:
+            lines.append(f"+ {change.group} {change.day} {change.slot}: {_lesson_name(change.new)}")
+        elif change.new is None:
+            lines.append(f"- {change.group} {change.day} {change.slot}: {_lesson_name(change.old)}")
+        else:
+            lines.append(f"~ {change.group} {change.day} {change.slot}: {_lesson_name(change.old)} -> {_lesson_name(change.new)}")
+    if len(changes) > limit:
+        lines.append(f"... and {len(changes) - limit} more.")
+    return "\n".join(lines)
+
+def log_changes(log_file, university, degree, changes):
+    """Append the applied changes to a JSON-lines change log."""
+    timestamp = time.strftime('%Y-%m-%dT%H:%M:%S')
+    with open(log_file, 'a') as f:
+        for change in changes:
+            entry = {'time': timestamp, 'university': university, 'degree': degree, **change._asdict()}
+            f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
@@ -0,0 +1,110 @@
+from excel_import import DAYS
+
+
+class ScheduleModel:
+    """All schedules with interned strings and lessons stored as tuples.
+
+    Every group gets an id and every day name an index, and a day's lessons
+    are kept as one tuple of (time slot, lesson tuple) pairs under
+    (group id, day index), so a day or week lookup is a couple of dict hits.
+    Repeated subjects, teachers, rooms and time slots share one string object.
+    `from_schedules` and `to_schedules` convert from and to the
+    schedules.json layout, keeping the order of everything.
+    """
+
+    def __init__(self):
+        self.strings = {}
+        self.days = []
+        self.day_index = {}
+        self.tree = {}
+        self.group_ids = {}
+        self.group_days = []
+        self.lessons = {}
+
+    @classmethod
+    def from_schedules(cls, schedules):
+        model = cls()
+        for day in DAYS:
+            model._day(day)
+        for university, university_data in schedules.items():
+            degrees = model.tree.setdefault(model._intern(university), {})
+            for degree, degree_data in university_data.get("degrees", {}).items():
+                degrees.setdefault(model._intern(degree), {})
+                model.replace_groups(university, degree, degree_data.get("groups", {}))
+        return model
+
+    def _intern(self, value):
+        return self.strings.setdefault(value, value) if isinstance(value, str) else value
+
+    def _day(self, day):
+        index = self.day_index.get(day)
+        if index is None:
+            index = self.day_index[day] = len(self.days)
+            self.days.append(self._intern(day))
+        return index
+
+    def replace_groups(self, university, degree, groups):
+        """Replace the given groups of a degree completely, like the stores do."""
+        degree_groups = self.tree.setdefault(self._intern(university), {}).setdefault(self._intern(degree), {})
+        for group, days in groups.items():
+            key = (self._intern(university), self._intern(degree), self._intern(group))
+            group_id = self.group_ids.get(key)
+            if group_id is None:
+                group_id = self.group_ids[key] = len(self.group_days)
+                self.group_days.append(())
+                degree_groups[self._intern(group)] = group_id
+            for day_index in self.group_days[group_id]:
+                del self.lessons[(group_id, day_index)]
+            day_indexes = []
+            for day, slots in days.items():
+                day_index = self._day(day)
+                day_indexes.append(day_index)
+                self.lessons[(group_id, day_index)] = tuple(
+                    (self._intern(slot), tuple(self._intern(value) for value in lesson)) for slot, lesson in slots.items()
+                )
+            self.group_days[group_id] = tuple(day_indexes)
+
+    def universities(self):
+        return list(self.tree)
+
+    def degrees(self, university):
+        return list(self.tree.get(university, {}))
+
+    def groups(self, university, degree):
+        return list(self.tree.get(university, {}).get(degree, {}))
+
+    def group_keys(self):
+        return list(self.group_ids)
+
+    def day(self, university, degree, group, day):
+        """The ((time slot, lesson), ...) pairs of a group on `day`, or None."""
+        group_id = self.group_ids.get((university, degree, group))
+        day_index = self.day_index.get(day)
+        if group_id is None or day_index is None:
+            return None
+        return self.lessons.get((group_id, day_index))
+
+    def _group_days(self, group_id):
+        return {
+            self.days[day_index]: {slot: list(lesson) for slot, lesson in self.lessons[(group_id, day_index)]}
+            for day_index in self.group_days[group_id]
+        }
+
+    def week(self, university, degree, group, days=DAYS):
+        """A group's day -> time slot -> lesson dict for `days`, empty days included."""
+        group_id = self.group_ids.get((university, degree, group))
+        return {
+            day: {slot: list(lesson) for slot, lesson in self.lessons.get((group_id, self.day_index.get(day)), ())}
+            for day in days
+        }
+
+    def degree_groups(self, university, degree):
+        """The groups of a degree in the schedules.json layout."""
+        return {group: self._group_days(group_id) for group, group_id in self.tree.get(university, {}).get(degree, {}).items()}
+
+    def to_schedules(self):
+        return {
+            university: {"degrees": {degree: {"groups": self.degree_groups(university, degree)} for degree in degrees}}
+            for university, degrees in self.tree.items()
+        }
+
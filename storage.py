@@ -0,0 +1,434 @@
+import argparse, atexit, contextlib, fcntl, json, os, signal, sqlite3, sys, tempfile, threading, time
+
+USERS_DATA_FILE = 'users_data.json'
+SCHEDULE_TIMES_FILE = 'schedule_times.json'
+SCHEDULES_FILE = 'schedules.json'
+SQLITE_FILE = 'bot.db'
+
+USER_FIELDS = ('first_name', 'username', 'university', 'degree', 'group')
+
+
+def is_active(info):
+    """Users whose chat is gone get 'active': False; saving the user again reactivates them."""
+    return info.get('active', True)
+
+
+def load_data(file):
+    if not os.path.exists(file):
+        return {}
+    with open(file, 'r') as f:
+        return json.load(f)
+
+def save_data(file, data):
+    with open(file, 'w') as f:
+        json.dump(data, f, indent=4)
+
+def write_atomic(file, content):
+    """Write `content` to a temp file next to `file` and rename it into place."""
+    directory = os.path.dirname(os.path.abspath(file))
+    fd, temp_file = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(file)}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, file)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+
+def exit_on_sigterm():
+    """Turn SIGTERM into SystemExit, so atexit handlers run on `kill` and service stops too.
+
+    SIGINT already raises KeyboardInterrupt. Only the main thread can set
+    handlers, and a handler the application installed itself is kept.
+    """
+    if threading.current_thread() is threading.main_thread() and signal.getsignal(signal.SIGTERM) == signal.SIG_DFL:
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+
+@contextlib.contextmanager
+def file_lock(file):
+    """Hold an exclusive lock on `file`.lock, shared by every process that writes `file`."""
+    with open(f"{file}.lock", 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+class JsonStore:
+    """The original storage layout: one JSON file per dataset.
+
+    With `flush_interval` > 0 changes are only marked dirty and a background
+    thread writes them at most every `flush_interval` seconds (and at exit,
+    including on SIGTERM);
+    otherwise every change is written straight away. Files are always written
+    as compact JSON through a temp file and `os.replace`.
+
+    The bot, the reminder service and the broadcast tools all write these
+    files, so every change is also kept as an operation until it is written.
+    A flush holds the file's lock, and if another process replaced the file
+    since it was read, re-reads it and replays the operations on top instead
+    of overwriting that process's changes.
+    """
+
+    def __init__(self, users_file=USERS_DATA_FILE, times_file=SCHEDULE_TIMES_FILE, schedules_file=SCHEDULES_FILE, flush_interval=0):
+        self.files = {'users': users_file, 'reminders': times_file, 'schedules': schedules_file}
+        self.data = {}
+        self.flush_interval = flush_interval
+        self.metrics = {'flushes': 0, 'bytes_written': 0, 'last_flush_latency': 0.0, 'total_flush_latency': 0.0}
+        self._dirty = set()
+        self._pending = {}
+        self._seen = {}
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        if flush_interval > 0:
+            self._stop = threading.Event()
+            self._flusher = threading.Thread(target=self._flush_loop, name='json-flush', daemon=True)
+            self._flusher.start()
+            atexit.register(self.close)
+            exit_on_sigterm()
+
+    def signature(self, name):
+        try:
+            stat = os.stat(self.files[name])
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _load(self, name):
+        if name in self._dirty:
+            self.flush()
+        with self._lock:
+            self._seen[name] = self.signature(name)
+            data = self.data[name] = load_data(self.files[name])
+            return data
+
+    def _loaded(self, name):
+        if name not in self.data or (name not in self._dirty and self.signature(name) != self._seen.get(name)):
+            self._load(name)
+        return self.data[name]
+
+    def _change(self, name, operation):
+        """Apply `operation` to the cached dataset and keep it for the next flush.
+
+        An operation that returns False changed nothing and is dropped.
+        """
+        with self._lock:
+            result = operation(self._loaded(name))
+            if result is not False:
+                self._pending.setdefault(name, []).append(operation)
+                self._dirty.add(name)
+        self._write_through()
+        return result
+
+    def _write_through(self):
+        if self.flush_interval <= 0:
+            self.flush()
+
+    def flush(self):
+        """Write every dirty dataset to disk."""
+        with self._flush_lock:
+            with self._lock:
+                names = list(self._dirty)
+            for name in names:
+                started = time.perf_counter()
+                with file_lock(self.files[name]):
+                    with self._lock:
+                        self._dirty.discard(name)
+                        operations = self._pending.pop(name, [])
+                        if self.signature(name) != self._seen.get(name):
+                            data = self.data[name] = load_data(self.files[name])
+                            for operation in operations:
+                                operation(data)
+                        content = json.dumps(self.data[name], separators=(',', ':')).encode()
+                    write_atomic(self.files[name], content)
+                    self._seen[name] = self.signature(name)
+                latency = time.perf_counter() - started
+                self.metrics['flushes'] += 1
+                self.metrics['bytes_written'] += len(content)
+                self.metrics['last_flush_latency'] = latency
+                self.metrics['total_flush_latency'] += latency
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error while flushing data files: {e}")
+
+    def close(self):
+        if self.flush_interval > 0:
+            self._stop.set()
+        self.flush()
+
+    def status(self):
+        metrics = self.metrics
+        average = metrics['total_flush_latency'] / metrics['flushes'] if metrics['flushes'] else 0.0
+        return f"JSON files: {metrics['flushes']} flushes, {metrics['bytes_written']} bytes written, last flush {metrics['last_flush_latency'] * 1000:.1f} ms, avg {average * 1000:.1f} ms"
+
+    def load_users(self):
+        return self._load('users')
+
+    def load_reminders(self):
+        return self._load('reminders')
+
+    def load_schedules(self):
+        schedules = self._load('schedules')
+        # Readers keep their own compact copy, so only hold on to the dict while
+        # it has unwritten changes; replace_groups reads the file again.
+        with self._lock:
+            if 'schedules' not in self._dirty:
+                self.data.pop('schedules', None)
+        return schedules
+
+    def save_user(self, user_id, info):
+        self._change('users', lambda users: users.update({str(user_id): info}))
+
+    def set_reminder(self, user_id, notify_time):
+        self._change('reminders', lambda reminders: reminders.update({str(user_id): notify_time}))
+
+    def remove_reminder(self, user_id):
+        return self._change('reminders', lambda reminders: reminders.pop(str(user_id), None) is not None)
+
+    def replace_groups(self, university, degree, groups):
+        def replace(schedules):
+            degree_data = schedules.setdefault(university, {"degrees": {}})["degrees"].setdefault(degree, {"groups": {}})
+            for group, days in groups.items():
+                degree_data["groups"][group] = days
+        self._change('schedules', replace)
+
+    def deactivate_users(self, user_ids):
+        user_ids = [str(user_id) for user_id in user_ids]
+        def deactivate(users):
+            changed = 0
+            for user_id in user_ids:
+                info = users.get(user_id)
+                if info is not None and is_active(info):
+                    info['active'] = False
+                    changed += 1
+            return changed or False
+        return self._change('users', deactivate) or 0
+
+
+class SQLiteStore:
+    """Users, reminder times and schedules in one SQLite database in WAL mode.
+
+    Each write touches only the affected rows, and every table has a version
+    counter in `meta` so other processes can tell when to reload.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        );
+        INSERT OR IGNORE INTO meta (name) VALUES ('users'), ('reminders'), ('schedules');
+
+        CREATE TABLE IF NOT EXISTS users (
+            chat_id TEXT PRIMARY KEY,
+            first_name TEXT,
+            username TEXT,
+            university TEXT,
+            degree TEXT,
+            grp TEXT,
+            active INTEGER NOT NULL DEFAULT 1,
+            empty_days TEXT
+        );
+        CREATE INDEX IF NOT EXISTS users_group ON users (university, degree, grp);
+
+        CREATE TABLE IF NOT EXISTS reminders (
+            chat_id TEXT PRIMARY KEY,
+            notify_time TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS reminders_time ON reminders (notify_time);
+
+        CREATE TABLE IF NOT EXISTS groups (
+            id INTEGER PRIMARY KEY,
+            university TEXT NOT NULL,
+            degree TEXT NOT NULL,
+            grp TEXT NOT NULL,
+            UNIQUE (university, degree, grp)
+        );
+
+        CREATE TABLE IF NOT EXISTS lessons (
+            group_id INTEGER NOT NULL REFERENCES groups (id),
+            position INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            slot TEXT NOT NULL,
+            lesson TEXT NOT NULL,
+            PRIMARY KEY (group_id, day, slot)
+        );
+        CREATE INDEX IF NOT EXISTS lessons_order ON lessons (group_id, position);
+    """
+
+    def __init__(self, path=SQLITE_FILE):
+        self.path = path
+        self._local = threading.local()
+        self.connection.executescript(self.SCHEMA)
+        columns = {row[1] for row in self.connection.execute('PRAGMA table_info(users)')}
+        for column, definition in (('active', 'INTEGER NOT NULL DEFAULT 1'), ('empty_days', 'TEXT')):
+            if column not in columns:
+                self.connection.execute(f'ALTER TABLE users ADD COLUMN {column} {definition}')
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def _write(self, name, statements):
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            changed = 0
+            for sql, params in statements:
+                changed += max(connection.execute(sql, params).rowcount, 0)
+            connection.execute('UPDATE meta SET version = version + 1 WHERE name = ?', (name,))
+            connection.execute('COMMIT')
+            return changed
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+    def close(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def status(self):
+        counts = {name: self.connection.execute(f'SELECT COUNT(*) FROM {name}').fetchone()[0] for name in ('users', 'reminders', 'lessons')}
+        return f"SQLite {self.path}: {counts['users']} users, {counts['reminders']} reminders, {counts['lessons']} lessons"
+
+    def signature(self, name):
+        row = self.connection.execute('SELECT version FROM meta WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else None
+
+    def load_users(self):
+        users = {}
+        for row in self.connection.execute('SELECT chat_id, first_name, username, university, degree, grp, active, empty_days FROM users ORDER BY rowid'):
+            info = users[row[0]] = dict(zip(USER_FIELDS, row[1:6]))
+            if not row[6]:
+                info['active'] = False
+            if row[7]:
+                info['empty_days'] = row[7]
+        return users
+
+    def load_reminders(self):
+        return dict(self.connection.execute('SELECT chat_id, notify_time FROM reminders ORDER BY rowid'))
+
+    def load_schedules(self):
+        schedules = {}
+        for university, degree, group in self.connection.execute('SELECT university, degree, grp FROM groups ORDER BY id'):
+            schedules.setdefault(university, {"degrees": {}})["degrees"].setdefault(degree, {"groups": {}})["groups"][group] = {}
+        rows = self.connection.execute("""
+            SELECT g.university, g.degree, g.grp, l.day, l.slot, l.lesson
+            FROM lessons l JOIN groups g ON g.id = l.group_id
+            ORDER BY l.group_id, l.position
+        """)
+        for university, degree, group, day, slot, lesson in rows:
+            schedules[university]["degrees"][degree]["groups"][group].setdefault(day, {})[slot] = json.loads(lesson)
+        return schedules
+
+    @staticmethod
+    def _user_statement(user_id, info):
+        return (
+            'INSERT OR REPLACE INTO users (chat_id, first_name, username, university, degree, grp, active, empty_days) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (str(user_id), *(info.get(field) for field in USER_FIELDS), int(is_active(info)), info.get('empty_days')),
+        )
+
+    @staticmethod
+    def _reminder_statement(user_id, notify_time):
+        return ('INSERT OR REPLACE INTO reminders (chat_id, notify_time) VALUES (?, ?)', (str(user_id), notify_time))
+
+    @staticmethod
+    def _group_statements(university, degree, groups):
+        statements = []
+        group_id = '(SELECT id FROM groups WHERE university = ? AND degree = ? AND grp = ?)'
+        for group, days in groups.items():
+            statements.append(('INSERT OR IGNORE INTO groups (university, degree, grp) VALUES (?, ?, ?)', (university, degree, group)))
+            statements.append((f'DELETE FROM lessons WHERE group_id = {group_id}', (university, degree, group)))
+            position = 0
+            for day, slots in days.items():
+                for slot, lesson in slots.items():
+                    statements.append((
+                        f'INSERT INTO lessons (group_id, position, day, slot, lesson) VALUES ({group_id}, ?, ?, ?, ?)',
+                        (university, degree, group, position, day, slot, json.dumps(lesson, ensure_ascii=False)),
+                    ))
+                    position += 1
+        return statements
+
+    def save_user(self, user_id, info):
+        self._write('users', [self._user_statement(user_id, info)])
+
+    def set_reminder(self, user_id, notify_time):
+        self._write('reminders', [self._reminder_statement(user_id, notify_time)])
+
+    def remove_reminder(self, user_id):
+        return self._write('reminders', [('DELETE FROM reminders WHERE chat_id = ?', (str(user_id),))]) > 0
+
+    def replace_groups(self, university, degree, groups):
+        statements = self._group_statements(university, degree, groups)
+        if statements:
+            self._write('schedules', statements)
+
+    def deactivate_users(self, user_ids):
+        user_ids = [str(user_id) for user_id in user_ids]
+        if not user_ids:
+            return 0
+        statements = []
+        for start in range(0, len(user_ids), 500):
+            chunk = user_ids[start:start + 500]
+            statements.append((f"UPDATE users SET active = 0 WHERE active = 1 AND chat_id IN ({', '.join('?' * len(chunk))})", chunk))
+        return self._write('users', statements)
+
+    def import_data(self, users, reminders, schedules):
+        """Load whole datasets, one transaction per table."""
+        self._write('users', [self._user_statement(user_id, info) for user_id, info in users.items()])
+        self._write('reminders', [self._reminder_statement(user_id, notify_time) for user_id, notify_time in reminders.items()])
+        statements = []
+        for university, university_data in schedules.items():
+            for degree, degree_data in university_data.get("degrees", {}).items():
+                statements.extend(self._group_statements(university, degree, degree_data.get("groups", {})))
+        self._write('schedules', statements)
+
+    def export_json(self, users_file=USERS_DATA_FILE, times_file=SCHEDULE_TIMES_FILE, schedules_file=SCHEDULES_FILE):
+        save_data(users_file, self.load_users())
+        save_data(times_file, self.load_reminders())
+        save_data(schedules_file, self.load_schedules())
+
+
+def open_store(env):
+    """Open the storage backend selected by STORAGE_BACKEND ('json' or 'sqlite')."""
+    backend = env("STORAGE_BACKEND", "json")
+    if backend == "sqlite":
+        return SQLiteStore(env("SQLITE_PATH", SQLITE_FILE))
+    if backend == "json":
+        return JsonStore(flush_interval=env.float("JSON_FLUSH_INTERVAL", 0))
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Move bot data between the JSON files and SQLite.")
+    parser.add_argument('command', choices=['migrate', 'export'], help="migrate: JSON files -> SQLite, export: SQLite -> JSON files")
+    parser.add_argument('--db', default=SQLITE_FILE)
+    parser.add_argument('--users', default=USERS_DATA_FILE)
+    parser.add_argument('--times', default=SCHEDULE_TIMES_FILE)
+    parser.add_argument('--schedules', default=SCHEDULES_FILE)
+    args = parser.parse_args()
+
+    store = SQLiteStore(args.db)
+    if args.command == 'migrate':
+        users, reminders, schedules = load_data(args.users), load_data(args.times), load_data(args.schedules)
+        store.import_data(users, reminders, schedules)
+        print(f"Migrated {len(users)} users, {len(reminders)} reminders and {len(schedules)} universities into {args.db}.")
+    else:
+        store.export_json(args.users, args.times, args.schedules)
+        print(f"Exported {args.db} to {args.users}, {args.times} and {args.schedules}.")
@@ -0,0 +1,128 @@
+import threading
+from storage import is_active
+
+
+class SubscriberIndex:
+    """university -> degree -> group -> set of chat ids of the active users, with their reminder times.
+
+    Built from the repository and kept current with `update_user`,
+    `set_reminder` and `remove_reminder`; it is rebuilt when the users or
+    reminders change in a way it was not told about (another process, pruning).
+    Audience queries cost O(result) instead of a scan over every user.
+    """
+
+    def __init__(self, repository):
+        self.repository = repository
+        self.tree = {}
+        self.user_groups = {}
+        self.reminders = {}
+        self._versions = None
+        self._loads = None
+        self._lock = threading.RLock()
+
+    def _current_versions(self):
+        return self.repository.signature('users'), self.repository.signature('reminders')
+
+    def _current_loads(self):
+        return self.repository.loads['users'], self.repository.loads['reminders']
+
+    def refresh(self):
+        """Rebuild the index if the repository changed behind its back."""
+        versions = self._current_versions()
+        if versions == self._versions:
+            return False
+        with self._lock:
+            self.tree, self.user_groups = {}, {}
+            for user_id, info in self.repository.users.items():
+                self._add(user_id, info)
+            self.reminders = {user_id: notify_time for user_id, notify_time in self.repository.reminders.items() if user_id in self.user_groups}
+            self._versions = versions
+            self._loads = self._current_loads()
+        return True
+
+    def mark_saved(self):
+        """Record the repository state after this process updated the index itself.
+
+        If the repository had to reload meanwhile, the index is left stale so the
+        next refresh picks up what the other process changed.
+        """
+        versions = self._current_versions()
+        if self._current_loads() == self._loads:
+            self._versions = versions
+
+    def _add(self, user_id, info):
+        if not is_active(info):
+            return
+        key = (info.get('university'), info.get('degree'), info.get('group'))
+        self.tree.setdefault(key[0], {}).setdefault(key[1], {}).setdefault(key[2], set()).add(user_id)
+        self.user_groups[user_id] = key
+
+    def _discard(self, user_id):
+        key = self.user_groups.pop(user_id, None)
+        if key is None:
+            return
+        university, degree, group = key
+        degrees = self.tree[university]
+        members = degrees[degree][group]
+        members.discard(user_id)
+        if not members:
+            del degrees[degree][group]
+            if not degrees[degree]:
+                del degrees[degree]
+                if not degrees:
+                    del self.tree[university]
+
+    def update_user(self, user_id, info):
+        user_id = str(user_id)
+        with self._lock:
+            self._discard(user_id)
+            self._add(user_id, info)
+            notify_time = self.repository.reminders.get(user_id)
+            if notify_time and user_id in self.user_groups:
+                self.reminders[user_id] = notify_time
+            else:
+                self.reminders.pop(user_id, None)
+
+    def set_reminder(self, user_id, notify_time):
+        user_id = str(user_id)
+        with self._lock:
+            if user_id in self.user_groups:
+                self.reminders[user_id] = notify_time
+
+    def remove_reminder(self, user_id):
+        with self._lock:
+            self.reminders.pop(str(user_id), None)
+
+    def audience(self, university=None, degree=None, group=None):
+        """Chat ids of the active users matching every given filter; no filters means everyone."""
+        self.refresh()
+        with self._lock:
+            if university is None:
+                return list(self.user_groups)
+            degrees = self.tree.get(university, {})
+            if degree is None:
+                return [user_id for groups in degrees.values() for members in groups.values() for user_id in members]
+            groups = degrees.get(degree, {})
+            if group is None:
+                return [user_id for members in groups.values() for user_id in members]
+            return list(groups.get(group, ()))
+
+    def users_in_groups(self, university, degree, groups):
+        self.refresh()
+        with self._lock:
+            degree_groups = self.tree.get(university, {}).get(degree, {})
+            return [user_id for group in dict.fromkeys(groups) for user_id in degree_groups.get(group, ())]
+
+    def breakdown(self):
+        """(university, degree, group, users, users with a reminder) for every group with users."""
+        self.refresh()
+        with self._lock:
+            return [
+                (university, degree, group, len(members), sum(user_id in self.reminders for user_id in members))
+                for university, degrees in self.tree.items()
+                for degree, groups in degrees.items()
+                for group, members in groups.items()
+            ]
+
+    def __len__(self):
+        return len(self.user_groups)
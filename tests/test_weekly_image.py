@@ -0,0 +1,87 @@
+import random
+
+import pytest
+from PIL import Image, ImageDraw
+
+import weekly_image
+
+LESSON_WORDS = [
+    "Mathematical", "Analysis", "Programming", "Physics", "Lab", "Advanced", "Introduction", "to", "and",
+    "Linear", "Algebra", "Databases", "Economics", "Philosophy", "Математический", "анализ", "Программирование",
+    "Физика", "Основы", "Supercalifragilisticexpialidocious", "I", "II", "(lecture)", "(seminar)",
+]
+TIME_SLOTS = ['9:00-10:20', '10:30-11:50', '12:00-13:20', '14:20-15:40', '15:50-17:10', '17:20-18:40', '18:50-20:10']
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+
+
+# The text layout weekly_image used before it was memoized, measuring every
+# candidate line with textbbox. The memoized layout must draw the same pixels.
+
+def reference_wrap_text(draw, text, font, max_width):
+    lines = []
+    for line in text.split('\n'):
+        words = line.split()
+        current_line = words[0] if len(words) != 0 else ""
+        for word in words[1:]:
+            bbox = draw.textbbox((0, 0), current_line + ' ' + word, font=font)
+            if bbox[2] - bbox[0] <= max_width:
+                current_line += ' ' + word
+            else:
+                lines.append(current_line)
+                current_line = word
+        lines.append(current_line)
+    return lines
+
+def reference_draw_centered_text(draw, text, rect, font, fill=(0, 0, 0)):
+    x1, y1, x2, y2 = rect
+    bbox = draw.textbbox((0, 0), text, font=font)
+    x = (x2 - x1 - (bbox[2] - bbox[0])) / 2 + x1
+    y = (y2 - y1 - (bbox[3] - bbox[1])) / 2 + y1
+    draw.text((x, y), text, font=font, fill=fill)
+
+def reference_draw_wrapped_text(draw, text, rect, font, fill=(0, 0, 0), line_spacing=20):
+    x1, y1, x2, y2 = rect
+    max_width = x2 - x1
+    line_height = font.getbbox('A')[1] + line_spacing
+    lines = reference_wrap_text(draw, text, font, max_width)
+    if line_height * len(lines) > (y2 - y1):
+        lines = lines[:(y2 - y1) // line_height]
+    y = y1 + (y2 - y1 - line_height * len(lines)) / 2
+    for line in lines:
+        bbox = draw.textbbox((0, 0), line, font=font)
+        draw.text((x1 + (max_width - (bbox[2] - bbox[0])) / 2, y), line, font=font, fill=fill)
+        y += line_height
+
+
+def lesson_name(rng):
+    return " ".join(rng.choice(LESSON_WORDS) for _ in range(rng.randint(1, 9)))
+
+def synthetic_week(rng):
+    return {
+        day: {slot: [lesson_name(rng), "Teacher", "Room"] for slot in rng.sample(TIME_SLOTS, rng.randint(0, len(TIME_SLOTS)))}
+        for day in DAYS
+    }
+
+def pixels(weekly_schedule):
+    image = weekly_image.generate_weekly_schedule_image(weekly_schedule, "University", "Degree", "Group")
+    return Image.open(image).tobytes()
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_timetable_matches_reference_layout(seed, monkeypatch):
+    week = synthetic_week(random.Random(seed))
+    # Render twice so the second image comes from the memoized layouts
+    memoized = [pixels(week), pixels(week)]
+    monkeypatch.setattr(weekly_image, 'draw_centered_text', reference_draw_centered_text)
+    monkeypatch.setattr(weekly_image, 'draw_wrapped_text', reference_draw_wrapped_text)
+    expected = pixels(week)
+    assert memoized == [expected, expected]
+
+def test_wrap_text_matches_reference():
+    rng = random.Random(1)
+    font = weekly_image.load_font(22)
+    draw = ImageDraw.Draw(Image.new('RGB', (250, 120)))
+    lessons = [lesson_name(rng) for _ in range(200)] + ["", "one", "two\nlines", "  padded   words  "]
+    for width in range(60, 401, 20):
+        for text in lessons:
+            assert weekly_image.wrap_text(draw, text, font, width) == reference_wrap_text(draw, text, font, width), (text, width)
@@ -0,0 +1,160 @@
+import argparse, ipaddress, json, threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from telebot.types import Update
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+def update_chat_id(update):
+    """The chat an update belongs to, used to keep each chat's updates in order."""
+    for message in (update.message, update.edited_message, update.channel_post, update.edited_channel_post):
+        if message is not None:
+            return message.chat.id
+    if update.callback_query is not None:
+        message = update.callback_query.message
+        return message.chat.id if message is not None else update.callback_query.from_user.id
+    return update.update_id
+
+
+class ChatQueues:
+    """Runs `process(update)` on a worker pool, one update at a time per chat.
+
+    Different chats are handled concurrently, while updates of the same chat
+    queue up behind each other so handlers and next-step handlers see them in
+    the order Telegram sent them.
+    """
+
+    def __init__(self, process, workers=16):
+        self.process = process
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='updates')
+        self.queues = {}
+        self.stats = {'received': 0, 'processed': 0, 'errors': 0}
+        self._idle = threading.Condition()
+
+    def put(self, chat_id, update):
+        with self._idle:
+            self.stats['received'] += 1
+            queue = self.queues.get(chat_id)
+            if queue is not None:
+                # A worker is already draining this chat and will get to it.
+                queue.append(update)
+                return
+            self.queues[chat_id] = deque([update])
+        self.executor.submit(self._drain, chat_id)
+
+    def _drain(self, chat_id):
+        while True:
+            with self._idle:
+                queue = self.queues[chat_id]
+                if not queue:
+                    del self.queues[chat_id]
+                    self._idle.notify_all()
+                    return
+                update = queue.popleft()
+            try:
+                self.process(update)
+            except Exception as e:
+                print(f"Error while handling update {update.update_id}: {e}")
+                with self._idle:
+                    self.stats['errors'] += 1
+            with self._idle:
+                self.stats['processed'] += 1
+
+    def wait_idle(self, timeout=None):
+        """Block until every queued update has been handled."""
+        with self._idle:
+            return self._idle.wait_for(lambda: not self.queues, timeout)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+def make_handler(path, queues, secret=None):
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != path:
+                self._reply(404)
+                return
+            if secret and self.headers.get(SECRET_HEADER) != secret:
+                self._reply(403)
+                return
+            try:
+                update = Update.de_json(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8'))
+            except (ValueError, KeyError) as e:
+                print(f"Rejected a malformed update: {e}")
+                self._reply(400)
+                return
+            # Answer right away; Telegram resends updates that are not acknowledged quickly.
+            queues.put(update_chat_id(update), update)
+            self._reply(200)
+
+        def _reply(self, status):
+            self.send_response(status)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    return WebhookHandler
+
+def is_loopback(host):
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+def run_webhook(bot, host='127.0.0.1', port=8443, path='/webhook', public_url=None, secret=None, workers=16):
+    """Serve updates posted to `path` instead of long polling.
+
+    With `public_url` the webhook is registered with Telegram first; without it
+    the server only accepts updates posted locally, e.g. by `python webhook.py post`.
+    Anyone who can reach the server could post forged updates, including admin
+    commands, so a `secret` is required unless it only listens on loopback
+    without a public URL.
+    """
+    if not secret and (public_url or not is_loopback(host)):
+        raise ValueError("A webhook secret is required when the server is reachable from outside")
+    # Handlers run on the per-chat queues, not on the bot's own thread pool.
+    bot.threaded = False
+    queues = ChatQueues(lambda update: bot.process_new_updates([update]), workers)
+    if public_url:
+        bot.remove_webhook()
+        bot.set_webhook(url=public_url.rstrip('/') + path, secret_token=secret)
+    server = ThreadingHTTPServer((host, port), make_handler(path, queues, secret))
+    print(f"Serving webhook updates on {host}:{port}{path} with {workers} workers.")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        queues.shutdown()
+
+
+def read_updates(file_name):
+    """Read recorded updates from a JSON list or a JSON-lines file."""
+    with open(file_name, 'r') as f:
+        content = f.read().strip()
+    if content.startswith('['):
+        return json.loads(content)
+    return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Post recorded Telegram updates to a local webhook server.")
+    parser.add_argument('command', choices=['post'])
+    parser.add_argument('updates', help="JSON list or JSON-lines file of updates")
+    parser.add_argument('--url', default='http://127.0.0.1:8443/webhook')
+    parser.add_argument('--secret')
+    args = parser.parse_args()
+
+    headers = {SECRET_HEADER: args.secret} if args.secret else {}
+    with requests.Session() as session:
+        for update in read_updates(args.updates):
+            response = session.post(args.url, json=update, headers=headers, timeout=10)
+            print(f"Update {update.get('update_id')}: {response.status_code}")
@@ -0,0 +1,188 @@
+import os, io, time
+from PIL import Image, ImageDraw, ImageFont
+
+FONT_PATH = os.path.join(os.path.dirname(__file__), "fonts", "RobotoSlab-Regular.ttf")
+
+_fonts = {}
+
+def load_font(size):
+    """Load the timetable font once per process and size."""
+    font = _fonts.get(size)
+    if font is None:
+        font = _fonts[size] = ImageFont.truetype(FONT_PATH, size)
+    return font
+
+def load_fonts():
+    for size in (22, 36):
+        load_font(size)
+
+def render_weekly_png(weekly_schedule, university, degree, group):
+    """Render the weekly timetable and return its PNG bytes with the render time in seconds."""
+    started = time.perf_counter()
+    image_data = generate_weekly_schedule_image(weekly_schedule, university, degree, group).getvalue()
+    return image_data, time.perf_counter() - started
+
+def generate_weekly_schedule_image(weekly_schedule, university, degree, group):
+    cell_width = 250
+    cell_height = 120
+    header_height = 100
+    num_days = 6
+    num_slots = 7
+
+    image_width = (num_days + 1) * cell_width
+    image_height = (num_slots + 1) * cell_height + header_height
+    
+    img = Image.new('RGB', (image_width, image_height), color=(255, 255, 255))
+    draw = ImageDraw.Draw(img)
+    font = load_font(22)
+    header_font = load_font(36)
+
+    # Draw header
+    header_text = f"University: {university} | Degree: {degree} | Group: {group}"
+    header_text_bbox = draw.textbbox((0, 0), header_text, font=header_font)
+    header_text_width = header_text_bbox[2] - header_text_bbox[0]
+    draw.text(
+        ((image_width - header_text_width) / 2, 20),
+        header_text, font=header_font, fill=(0, 0, 0)
+    )
+    
+    # Draw table
+    table_top = header_height
+    for i in range(num_days + 2):
+        for j in range(num_slots + 1):
+            top_left = (i * cell_width, table_top + j * cell_height)
+            bottom_right = ((i + 1) * cell_width, table_top + (j + 1) * cell_height)
+            draw.rectangle([top_left, bottom_right], outline=(0, 0, 0), width=2)
+
+    # Fill in days
+    days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+    for i, day in enumerate(days):
+        draw_centered_text(draw, day, ((i + 1) * cell_width, table_top, (i + 2) * cell_width, table_top + cell_height), font)
+
+    # Fill in time slots
+    time_slots = ['9:00-10:20', '10:30-11:50', '12:00-13:20', '14:20-15:40', '15:50-17:10', '17:20-18:40', '18:50-20:10']
+    for j, time_slot in enumerate(time_slots):
+        draw_centered_text(draw, time_slot, (0, table_top + (j + 1) * cell_height, cell_width, table_top + (j + 2) * cell_height), font)
+        
+        for i, day in enumerate(days):
+            lessons = weekly_schedule.get(day, {}).get(time_slot, [])
+            if lessons:
+                lesson_text = lessons[0]
+                cell_rect = ((i + 1) * cell_width, table_top + (j + 1) * cell_height, (i + 2) * cell_width, table_top + (j + 2) * cell_height)
+                draw_wrapped_text(draw, lesson_text, cell_rect, font)
+
+    img_byte_array = io.BytesIO()
+    img.save(img_byte_array, format='PNG')
+    img_byte_array.seek(0)
+    
+    return img_byte_array
+
+MEASUREMENT_CACHE_SIZE = 50000
+
+_measurements = {}
+_advances = {}
+_layouts = {}
+
+def _font_key(font):
+    return (font.path, font.size)
+
+def _remember(cache, key, value):
+    if len(cache) >= MEASUREMENT_CACHE_SIZE:
+        cache.clear()
+    cache[key] = value
+    return value
+
+def text_bbox(draw, text, font):
+    """Memoized `draw.textbbox((0, 0), text, font=font)` for single-line text."""
+    key = (_font_key(font), draw.fontmode, text)
+    bbox = _measurements.get(key)
+    if bbox is None:
+        bbox = _remember(_measurements, key, draw.textbbox((0, 0), text, font=font))
+    return bbox
+
+def token_advance(font, token):
+    key = (_font_key(font), token)
+    advance = _advances.get(key)
+    if advance is None:
+        advance = _remember(_advances, key, font.getlength(token))
+    return advance
+
+def wrap_text(draw, text, font, max_width):
+    """Greedy word wrap that decides from cumulative advance widths.
+
+    Advances ignore side bearings and kerning across words, so only candidates
+    within one em of `max_width` are measured exactly with `textbbox`; the
+    resulting lines are the same as measuring every candidate.
+    """
+    margin = font.size
+    space = token_advance(font, ' ')
+    lines = []
+
+    for line in text.split('\n'):
+        words = line.split()
+        current_line = words[0] if len(words) != 0 else ""
+        current_advance = token_advance(font, current_line)
+        for word in words[1:]:
+            candidate_advance = current_advance + space + token_advance(font, word)
+            if candidate_advance + margin <= max_width:
+                fits = True
+            elif candidate_advance - margin > max_width:
+                fits = False
+            else:
+                bbox = text_bbox(draw, current_line + ' ' + word, font)
+                fits = bbox[2] - bbox[0] <= max_width
+            if fits:
+                current_line += ' ' + word
+                current_advance = candidate_advance
+            else:
+                lines.append(current_line)
+                current_line = word
+                current_advance = token_advance(font, word)
+        lines.append(current_line)
+
+    return lines
+
+def centered_offset(draw, text, width, height, font):
+    key = ('centered', _font_key(font), draw.fontmode, text, width, height)
+    offset = _layouts.get(key)
+    if offset is None:
+        bbox = text_bbox(draw, text, font)
+        text_width = bbox[2] - bbox[0]
+        text_height = bbox[3] - bbox[1]
+        offset = _remember(_layouts, key, ((width - text_width) / 2, (height - text_height) / 2))
+    return offset
+
+def wrapped_layout(draw, text, width, height, font, line_spacing):
+    """Return `(x offset, y offset, line)` for every line of wrapped, centered text."""
+    key = ('wrapped', _font_key(font), draw.fontmode, text, width, height, line_spacing)
+    layout = _layouts.get(key)
+    if layout is not None:
+        return layout
+
+    line_height = font.getbbox('A')[1] + line_spacing  # Add line spacing to line height
+    lines = wrap_text(draw, text, font, width)
+
+    total_height = line_height * len(lines)
+    max_lines = height // line_height  # Number of lines that can fit in the cell
+    if total_height > height:
+        lines = lines[:max_lines]  # Limit the lines to fit in the cell
+
+    layout = []
+    y = (height - line_height * len(lines)) / 2
+    for line in lines:
+        bbox = text_bbox(draw, line, font)
+        w = bbox[2] - bbox[0]
+        layout.append(((width - w) / 2, y, line))  # Center the text horizontally
+        y += line_height  # Move down for the next line
+
+    return _remember(_layouts, key, tuple(layout))
+
+def draw_centered_text(draw, text, rect, font, fill=(0, 0, 0)):
+    x1, y1, x2, y2 = rect
+    dx, dy = centered_offset(draw, text, x2 - x1, y2 - y1, font)
+    draw.text((dx + x1, dy + y1), text, font=font, fill=fill)
+
+def draw_wrapped_text(draw, text, rect, font, fill=(0, 0, 0), line_spacing=20):
+    x1, y1, x2, y2 = rect
+    for dx, dy, line in wrapped_layout(draw, text, x2 - x1, y2 - y1, font, line_spacing):
+        draw.text((x1 + dx, y1 + dy), line, font=font, fill=fill)